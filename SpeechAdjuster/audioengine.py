@@ -0,0 +1,95 @@
+#######################################################
+## Output stream of the SpeechAdjuster tool in which the
+## target speech and the masker are mixed.
+#######################################################
+#######################################################
+## Author: Olympia Simantiraki
+## License: GNU GPL v3
+## Version: v1.0.0
+## Email: olina.simantiraki@gmail.com
+#######################################################
+
+import time
+import numpy as np
+
+from backends import PyAudioBackend
+
+
+class AudioEngine:
+    """Opens one output stream for the whole session. On every chunk its callback asks the target speech and the masker
+        sources for their samples and sums them. A source is a function source(out, frame_count, time_info) which writes
+        float samples in [-1, 1] into out (frame_count x nchannels, initially zeros). Setting target or masker to None
+        silences it; the stream itself keeps running until close() is called. The samples of the target speech and of
+        the masker are multiplied by target_gain and masker_gain (see snr.py). position is the number of frames
+        produced before the current chunk and latency the output latency (in seconds) reported by the backend.
+        If telemetry (a telemetry.Telemetry) is set, every call of the callback is recorded in it.
+        The stream carries float samples, so the stimuli and the masker are all converted once, when they are loaded,
+        to its rate and number of channels (see resample.py) and the stream is never reopened for a change of format.
+       rate: Sample rate of the output stream; the default rate of the backend if None
+       nchannels: Number of channels of the output stream
+       chunk: Length (in seconds) of the buffers of the output stream
+       backend: Backend that pulls the stream (see backends.py); the output device (PyAudio) if None
+    """
+
+    def __init__(self, rate, nchannels, chunk, backend=None):
+        self.backend = backend or PyAudioBackend()
+        self.rate = rate or self.backend.default_rate()
+        self.nchannels = nchannels
+        self.chunk = max(int(chunk * self.rate), 1)
+        self.target = None
+        self.masker = None
+        self.target_gain = 1.
+        self.masker_gain = 1.
+        self.position = 0
+        self.telemetry = None
+
+        self._allocate(self.chunk)
+
+        self.backend.open(self.rate, nchannels, self.chunk, self.callback)
+        self.latency = self.backend.latency
+
+    def _allocate(self, frames):
+        self._mix = np.zeros((frames, self.nchannels), dtype=np.float32)
+        self._tbuf = np.zeros((frames, self.nchannels), dtype=np.float32)
+        self._mbuf = np.zeros((frames, self.nchannels), dtype=np.float32)
+
+    def callback(self, frame_count, time_info, status):
+        start = time.perf_counter_ns()
+        if frame_count > len(self._mix):
+            self._allocate(frame_count)
+
+        mix = self._mix[:frame_count]
+        mix.fill(0)
+
+        # read the attributes once, the UI thread may change them meanwhile
+        target, masker = self.target, self.masker
+        if target is not None:
+            out = self._tbuf[:frame_count]
+            out.fill(0)
+            target(out, frame_count, time_info)
+            gain = self.target_gain
+            if gain != 1:
+                out *= gain
+            mix += out
+        if masker is not None:
+            out = self._mbuf[:frame_count]
+            out.fill(0)
+            masker(out, frame_count, time_info)
+            gain = self.masker_gain
+            if gain != 1:
+                out *= gain
+            mix += out
+
+        np.clip(mix, -1, 1, out=mix)
+        self.position += frame_count
+
+        telemetry = self.telemetry
+        if telemetry is not None:
+            telemetry.record(frame_count, time.perf_counter_ns() - start, status, time_info)
+
+        return mix.tobytes()
+
+    def close(self):
+        self.target = None
+        self.masker = None
+        self.backend.close()
@@ -0,0 +1,161 @@
+#######################################################
+## Audio backends of the output stream: the sound card
+## (PyAudio), a null sink and a .wav file sink.
+#######################################################
+#######################################################
+## Author: Olympia Simantiraki
+## License: GNU GPL v3
+## Version: v1.0.0
+## Email: olina.simantiraki@gmail.com
+#######################################################
+
+## A backend pulls the samples of the AudioEngine: once opened, it calls callback(frame_count, time_info, status), which
+## returns the next frame_count frames of float32 samples (bytes), every chunk frames, until it is closed. time_info has
+## the keys of PortAudio's (current_time and output_buffer_dac_time, in seconds) and status its flags. A backend has
+## default_rate() (the rate used when none is asked for), open(rate, nchannels, chunk, callback), close() and latency
+## (the output latency, in seconds, known once it is opened).
+##
+## The null and file sinks need no sound card: a thread pulls the chunks at real-time pace (speed 1), speed times faster
+## than real time, or as fast as possible (speed 0). With speed None no thread is started and the chunks are pulled by
+## calling pull(), e.g. from a test. Their clock is time.monotonic(), as for the input events (see latency.py).
+
+import time
+import wave
+import threading
+import numpy as np
+
+from stimulusbank import to_pcm
+
+names = ('pyaudio', 'null', 'file')
+
+
+class PyAudioBackend:
+    """Output stream of the default output device, through PyAudio.
+    """
+
+    def __init__(self):
+        import pyaudio  # imported here so that the null and file sinks run without it
+
+        self.pyaudio = pyaudio
+        self.p = pyaudio.PyAudio()
+        self.stream = None
+        self.latency = 0.
+
+    def default_rate(self):
+        return int(self.p.get_default_output_device_info()['defaultSampleRate'])
+
+    def open(self, rate, nchannels, chunk, callback):
+        def stream_callback(in_data, frame_count, time_info, status):
+            return callback(frame_count, time_info, status), self.pyaudio.paContinue
+
+        self.stream = self.p.open(format=self.pyaudio.paFloat32,
+                                  channels=nchannels,
+                                  rate=rate,
+                                  output=True,
+                                  stream_callback=stream_callback, frames_per_buffer=chunk)
+        self.latency = self.stream.get_output_latency()
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+        self.p.terminate()
+
+
+class NullBackend:
+    """Pulls the chunks of the output stream and discards them (see above).
+       speed: Pace of the thread that pulls the chunks, relative to real time (0: as fast as possible, None: no thread)
+       rate: Default rate of the sink
+    """
+
+    def __init__(self, speed=1., rate=48000):
+        self.speed = speed
+        self.rate = rate
+        self.latency = 0.
+        self.frames = 0  # frames pulled
+        self._stop = threading.Event()
+        self._thread = None
+
+    def default_rate(self):
+        return self.rate
+
+    def open(self, rate, nchannels, chunk, callback):
+        self.rate = rate
+        self.nchannels = nchannels
+        self.chunk = chunk
+        self.callback = callback
+        # a chunk is heard once it has been pulled, so the sink's latency is one chunk
+        self.latency = chunk / rate
+        if self.speed is not None:
+            self._thread = threading.Thread(target=self._run, name='audio sink', daemon=True)
+            self._thread.start()
+
+    def pull(self, chunks=1):
+        """Pulls the given number of chunks in the calling thread.
+        """
+        for i in range(chunks):
+            now = time.monotonic()
+            data = self.callback(self.chunk, {'current_time': now, 'output_buffer_dac_time': now + self.latency}, 0)
+            self.frames += self.chunk
+            self.write(data)
+
+    def write(self, data):
+        pass
+
+    def _run(self):
+        start = time.monotonic()
+        while not self._stop.is_set():
+            self.pull()
+            if self.speed:
+                # sleep until the chunks pulled so far have been played
+                wait = start + self.frames / self.rate / self.speed - time.monotonic()
+                if wait > 0:
+                    self._stop.wait(wait)
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+class FileBackend(NullBackend):
+    """Writes the chunks of the output stream (the mix of the target speech and the masker) to a .wav file.
+       filename: Path of the .wav file
+       sampwidth: Sample width (in bytes) of the .wav file
+       speed, rate: See NullBackend
+    """
+
+    def __init__(self, filename, sampwidth=2, speed=1., rate=48000):
+        super().__init__(speed, rate)
+        self.filename = filename
+        self.sampwidth = sampwidth
+        self.wf = None
+
+    def open(self, rate, nchannels, chunk, callback):
+        self.wf = wave.open(self.filename, 'wb')
+        self.wf.setnchannels(nchannels)
+        self.wf.setsampwidth(self.sampwidth)
+        self.wf.setframerate(rate)
+        super().open(rate, nchannels, chunk, callback)
+
+    def write(self, data):
+        samples = np.frombuffer(data, dtype=np.float32).reshape(-1, self.nchannels)
+        self.wf.writeframes(to_pcm(samples, self.sampwidth).tobytes())
+
+    def close(self):
+        super().close()
+        if self.wf is not None:
+            self.wf.close()
+            self.wf = None
+
+
+def backend(name, filename=None, speed=1., sampwidth=2):
+    """Returns the backend name (one of names); filename is the .wav file of the file sink.
+    """
+    if name == 'pyaudio':
+        return PyAudioBackend()
+    if name == 'null':
+        return NullBackend(speed)
+    if name == 'file':
+        return FileBackend(filename, sampwidth, speed)
+    raise ValueError('Unknown audio backend ' + str(name) + '. It should be one of ' + str(names) + '.')
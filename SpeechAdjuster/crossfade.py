@@ -0,0 +1,103 @@
+#######################################################
+## Crossfading of the target speech on level changes.
+#######################################################
+#######################################################
+## Author: Olympia Simantiraki
+## License: GNU GPL v3
+## Version: v1.0.0
+## Email: olina.simantiraki@gmail.com
+#######################################################
+
+import numpy as np
+
+curves = ('linear', 'equalpower')
+
+# ramp tables already computed, keyed by (rate, length in frames, curve)
+_ramps = {}
+
+
+def ramps(rate, length, curve):
+    """Returns the fade-in and fade-out ramps (length x 1 arrays) of a crossfade of length seconds.
+        Each table is computed once per sample rate, length and curve.
+       curve: 'linear' or 'equalpower' (constant power for uncorrelated signals)
+    """
+    frames = max(int(length * rate), 1)
+    key = (rate, frames, curve)
+    if key not in _ramps:
+        x = np.arange(frames, dtype=np.float64) / frames
+        if curve == 'linear':
+            fade_in = x
+        elif curve == 'equalpower':
+            fade_in = np.sin(0.5 * np.pi * x)
+        else:
+            raise ValueError('Unknown crossfade curve ' + str(curve) + '. It should be one of ' + str(curves) + '.')
+        # the fade-out is the time reversed fade-in, so that a fade can be reversed half-way at the same gain
+        fade_out = np.concatenate(([1.], fade_in[:0:-1]))
+        _ramps[key] = (fade_in.astype(np.float32)[:, np.newaxis], fade_out.astype(np.float32)[:, np.newaxis])
+    return _ramps[key]
+
+
+class Crossfader:
+    """Fades in the target speech of a new level while the readers of the previous levels fade out. Changes that
+        arrive while a fade is still running are handled: the reader being faded in starts fading out from the gain
+        it has reached and the older readers keep fading out. All buffers are allocated in advance.
+       rate, nchannels: Format of the samples
+       chunk: Frames per buffer of the output stream
+       length: Length (in seconds) of the crossfade
+       curve: 'linear' or 'equalpower'
+       voices: Maximum number of readers fading out at the same time
+    """
+
+    def __init__(self, rate, nchannels, chunk, length=0.02, curve='linear', voices=4):
+        self.fade_in, self.fade_out = ramps(rate, length, curve)
+        self.length = len(self.fade_in)
+        self._buf = np.zeros((chunk, nchannels), dtype=np.float32)
+        self.readers = [None] * voices
+        self.positions = [0] * voices
+        self.inpos = self.length
+
+    def reset(self):
+        """Drops the readers still fading out; the next samples are not faded in.
+        """
+        self.readers = [None] * len(self.readers)
+        self.inpos = self.length
+
+    def switch(self, reader):
+        """Starts fading out reader (the current one) from the next chunk on. The reader that replaces it is faded in.
+        """
+        # a reader that has not been completely faded in continues at the gain it has reached
+        pos = self.length - self.inpos if self.inpos < self.length else 0
+
+        if None in self.readers:
+            v = self.readers.index(None)
+        else:
+            # all the voices are busy: replace the one closest to the end of its fade
+            v = self.positions.index(max(self.positions))
+        self.readers[v] = reader
+        self.positions[v] = pos
+        self.inpos = 0
+
+    def mix(self, out, n):
+        """Applies the fade-in to the n frames just read into out and adds the readers that fade out.
+        """
+        if self.inpos < self.length:
+            k = min(n, self.length - self.inpos)
+            np.multiply(out[:k], self.fade_in[self.inpos:self.inpos + k], out=out[:k])
+            self.inpos += min(len(out), self.length - self.inpos)
+
+        for v, reader in enumerate(self.readers):
+            if reader is None:
+                continue
+            if len(self._buf) < len(out):
+                self._buf = np.zeros((len(out), self._buf.shape[1]), dtype=np.float32)
+
+            pos = self.positions[v]
+            k = min(len(out), self.length - pos)
+            buf = self._buf[:k]
+            m = reader.read(buf)
+            np.multiply(buf[:m], self.fade_out[pos:pos + m], out=buf[:m])
+            out[:m] += buf[:m]
+
+            self.positions[v] = pos + k
+            if m < k or pos + k >= self.length:
+                self.readers[v] = None
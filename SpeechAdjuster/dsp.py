@@ -0,0 +1,359 @@
+#######################################################
+## Levels of the target speech rendered while it is
+## played (parameter levelmode = dsp): gain, spectral
+## tilt or pitch applied to every chunk.
+#######################################################
+#######################################################
+## Author: Olympia Simantiraki
+## License: GNU GPL v3
+## Version: v1.0.0
+## Email: olina.simantiraki@gmail.com
+#######################################################
+
+## The tilt of a level is a linear-phase FIR filter (TAPS coefficients, designed by frequency sampling) applied by
+## overlap-save: every block of NFFT input frames gives NFFT - TAPS + 1 output frames. The spectra of the filters of
+## all the levels are computed once, when the bank of a block is loaded. The input of a block overlaps the previous one
+## by TAPS - 1 frames (the state of the filter), read again from the unprocessed stimulus held by the bank, so a reader
+## can start at any position and the readers of two levels crossfaded at the same position stay aligned. The delay of
+## the filter is compensated: a frame of the output is at the position of the input frame it is centred on.
+##
+## The pitch of a level is shifted by a phase vocoder that keeps the duration: STFT frames of about FRAME seconds (Hann
+## window, hop of a quarter of a frame) are analysed at fixed positions of the stimulus, the energy of every bin moves
+## to the bin of its frequency times the ratio of the level and the frames are resynthesized with accumulated phases
+## and overlap-added. All the frames of a read are processed together. The analysis reads the stimulus again (one
+## frame before the first one synthesized gives the phase differences); the synthesis phases and the overlap-add tail
+## are the state carried by the reader from one read to the next. As the duration is kept, all the levels of a stimulus
+## have the same length and a level change continues at the same position.
+
+import sys
+import os
+import time
+import random
+import argparse
+from configparser import ConfigParser
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from stimulusbank import StimulusBank, BankReader, to_float, to_pcm
+from manifest import load_stimuli
+
+VERSION = 1  # of the processing, files rendered by render.py with another version are rendered again
+
+features = ('gain', 'tilt', 'pitch')
+units = {'gain': 'dB', 'tilt': 'dB/oct', 'pitch': 'st'}
+
+TAPS = 511
+NFFT = 4096
+REFERENCE = 1000.  # frequency (Hz) around which the spectrum is tilted
+LOWEST = 50.       # frequency (Hz) below which the response of a tilt is flat
+FRAME = 0.046      # length (in seconds) of the frames of the phase vocoder, rounded to a power of two
+
+# levels already computed, keyed by (feature, low, high, numlevels, rate)
+_levels = {}
+
+
+def tilt_filter(tilt, rate, taps=TAPS):
+    """Returns the coefficients of a linear-phase FIR filter whose magnitude response has a slope of tilt dB/octave
+        around REFERENCE. The filter has unit energy, so the power of a white signal is not changed.
+    """
+    n = taps - 1
+    f = np.maximum(np.fft.rfftfreq(n, 1. / rate), LOWEST)
+    h = np.roll(np.fft.irfft(10 ** (tilt * np.log2(f / REFERENCE) / 20), n), n // 2)
+    h = np.append(h, h[0]) * np.hanning(taps)
+    return h / np.sqrt(np.sum(h ** 2))
+
+
+def frame_length(rate):
+    """Length (in frames) of the frames of the phase vocoder at the given sample rate.
+    """
+    return 2 ** int(round(np.log2(FRAME * rate)))
+
+
+class Levels:
+    """Value of the feature at each level (evenly spaced from low at level 1 to high at level numlevels) and what is
+        applied to the samples: a gain per level, or for the tilt the spectrum (NFFT // 2 + 1 bins) of a filter per level.
+        For the pitch, the ratio of the frequencies of each level and the bin every bin is moved to.
+       feature: 'gain' (dB), 'tilt' (dB/octave) or 'pitch' (semitones)
+       rate: Sample rate of the stimuli
+    """
+
+    def __init__(self, feature, low, high, numlevels, rate):
+        if feature not in features:
+            raise ValueError('Unknown feature ' + str(feature) + '. It should be one of ' + str(features) + '.')
+        self.feature = feature
+        self.values = np.linspace(low, high, numlevels)
+        self.gains = (10 ** (self.values / 20)).astype(np.float32)
+        self.spectra = None
+        if feature == 'tilt':
+            self.spectra = np.array([np.fft.rfft(tilt_filter(v, rate), NFFT) for v in self.values]).astype(np.complex64)
+        if feature == 'pitch':
+            self.frame = frame_length(rate)
+            self.hop = self.frame // 4
+            self.window = 0.5 - 0.5 * np.cos(2 * np.pi * np.arange(self.frame) / self.frame)
+            # centre frequency (radians per frame) of every bin advanced by one hop
+            self.advance = 2 * np.pi * self.hop * np.arange(self.frame // 2 + 1) / self.frame
+            self.ratios = 2 ** (self.values / 12)
+            bins = np.arange(self.frame // 2 + 1)
+            self.targets = [np.round(bins * r).astype(np.intp) for r in self.ratios]
+
+    def label(self, level):
+        return self.feature + '=' + '%g' % self.values[level - 1] + units[self.feature]
+
+
+def levels(feature, low, high, numlevels, rate):
+    """Returns the Levels of the given feature, computed once per range, number of levels and sample rate.
+    """
+    key = (feature, low, high, numlevels, rate)
+    if key not in _levels:
+        _levels[key] = Levels(feature, low, high, numlevels, rate)
+    return _levels[key]
+
+
+class DspBank(StimulusBank):
+    """Holds the unprocessed target speech of a block (as the only level of a StimulusBank) and renders the level
+        asked for while it is read. Only one copy of every stimulus is in memory, whatever the number of levels.
+       stimuli: Index of the folder of unprocessed stimuli (see manifest.Sources)
+       numlevels: Number of levels
+       wavids: Filenames of the stimuli
+       budget: Maximum memory (in bytes) the bank can allocate
+       mode: 'memory', 'mmap' or 'auto' (see StimulusBank)
+       feature, low, high: Feature and its values at the lowest and the highest level (see Levels)
+       rate, nchannels: Format of the output stream, the levels are rendered at this rate (see StimulusBank)
+    """
+
+    def __init__(self, stimuli, numlevels, wavids, budget, mode, feature, low, high, rate=None, nchannels=None):
+        super().__init__(stimuli, 1, wavids, budget, mode, rate, nchannels)
+        self.levels = levels(feature, low, high, numlevels, self.framerate)
+        # input of one block of the filter; the readers of a bank are only read by the audio callback, one at a time
+        self._input = np.zeros((NFFT, self.nchannels), dtype=np.float32)
+
+    def levelpath(self, level):
+        """Path of the folder with the level's rendering in place of its prefixN (e.g. folder:tilt=-3dB/oct).
+        """
+        return os.path.normpath(self.folder) + ':' + self.levels.label(level)
+
+    def path(self, level, wavid):
+        return os.path.join(self.folder, wavid)
+
+    def open(self, level, wavid):
+        """Returns a reader of the stimulus wavid rendered at the given level (see BankReader).
+        """
+        return DspReader(self, self.stimulus(1, wavid), level)
+
+    def prefetch(self, level, wavid):
+        # every level is rendered from the unprocessed stimulus
+        super().prefetch(1, wavid)
+
+
+class DspReader(BankReader):
+    """BankReader that renders its level on the samples it reads.
+    """
+
+    def __init__(self, bank, frames, level):
+        super().__init__(bank, frames)
+        levels = bank.levels
+        self.gain = levels.gains[level - 1]
+        self.spectrum = None if levels.spectra is None else levels.spectra[level - 1][:, np.newaxis]
+        if levels.feature == 'pitch':
+            self.ratio = levels.ratios[level - 1]
+            keep = levels.targets[level - 1] < len(levels.advance)
+            self.sources = np.flatnonzero(keep)
+            self.targets = levels.targets[level - 1][keep]
+            self.expected = None  # position the synthesis state is for, None before the first read
+
+    def readframes(self, n):
+        out = np.zeros((min(n, len(self.frames) - self.pos), self.bank.nchannels), dtype=np.float32)
+        self.read(out)
+        return to_pcm(out, self.bank.sampwidth).tobytes()
+
+    def read(self, out):
+        """Reads the next frames, rendered at the reader's level, as float samples into out and returns the number of
+        frames read.
+        """
+        n = min(len(out), len(self.frames) - self.pos)
+        if self.bank.levels.feature == 'pitch':
+            self._pitch(out, n)
+            self.pos += n
+            return n
+        if self.spectrum is None:
+            to_float(self.frames[self.pos:self.pos + n], out[:n])
+            np.multiply(out[:n], self.gain, out=out[:n])
+            self.pos += n
+            return n
+
+        buf = self.bank._input
+        half = (TAPS - 1) // 2
+        step = NFFT - TAPS + 1
+        done = 0
+        while done < n:
+            k = min(step, n - done)
+            # input frames pos - half .. pos + k + half, zeros outside the stimulus
+            start = self.pos + done - half
+            lo, hi = max(start, 0), min(start + k + TAPS - 1, len(self.frames))
+            buf.fill(0)
+            to_float(self.frames[lo:hi], buf[lo - start:hi - start])
+            y = np.fft.irfft(np.fft.rfft(buf, axis=0) * self.spectrum, NFFT, axis=0)
+            out[done:done + k] = y[TAPS - 1:TAPS - 1 + k]
+            done += k
+        self.pos += n
+        return n
+
+    def _analyse(self, first, last):
+        """STFT (frames first..last, frames x channels x bins) of the stimulus.
+        """
+        levels = self.bank.levels
+        start, stop = first * levels.hop, last * levels.hop + levels.frame
+        x = np.zeros((stop - start, self.bank.nchannels), dtype=np.float32)
+        lo, hi = max(start, 0), min(stop, len(self.frames))
+        if hi > lo:
+            to_float(self.frames[lo:hi], x[lo - start:hi - start])
+        # frames x channels x samples, a view of x: frame i starts hop * i samples after the first
+        frames = np.lib.stride_tricks.as_strided(x, shape=(last - first + 1, x.shape[1], levels.frame),
+                                                 strides=(x.strides[0] * levels.hop, x.strides[1], x.strides[0]),
+                                                 writeable=False)
+        return np.fft.rfft(frames * levels.window, axis=-1)
+
+    def _pitch(self, out, n):
+        levels = self.bank.levels
+        frame, hop = levels.frame, levels.hop
+        if n <= 0:
+            return
+        end = self.pos + n
+        if self.expected != self.pos:
+            # first read or after setpos: start from the first frame that covers pos (frames before the beginning of
+            # the stimulus are zeros, they complete the overlap-add of its first frames)
+            self.next = (self.pos - frame) // hop + 1
+            self.origin = self.next * hop
+            self.ola = np.zeros((frame + n, self.bank.nchannels), dtype=np.float32)
+            self.phase = None
+
+        last = (end - 1) // hop
+        if last >= self.next:
+            spectra = self._analyse(self.next - 1, last)
+            magnitude = np.abs(spectra[1:])
+            phase = np.angle(spectra)
+            # deviation of every bin's phase advance from that of its centre frequency, wrapped to [-pi, pi]
+            delta = np.diff(phase, axis=0) - levels.advance
+            delta -= 2 * np.pi * np.round(delta / (2 * np.pi))
+
+            shifted = np.zeros_like(magnitude)
+            np.add.at(shifted, (slice(None), slice(None), self.targets), magnitude[..., self.sources])
+            advance = np.zeros_like(magnitude)
+            advance[..., self.targets] = (levels.advance[self.sources] + delta[..., self.sources]) * self.ratio
+
+            if self.phase is None:
+                self.phase = np.zeros(magnitude.shape[1:])
+                self.phase[..., self.targets] = phase[0][..., self.sources] * self.ratio
+            phases = self.phase + np.cumsum(advance, axis=0)
+            self.phase = np.mod(phases[-1], 2 * np.pi)
+            y = np.fft.irfft(shifted * np.exp(1j * phases), frame, axis=-1) * (levels.window / 1.5)
+
+            size = last * hop + frame - self.origin
+            if len(self.ola) < size:
+                self.ola = np.concatenate((self.ola, np.zeros((size - len(self.ola), self.bank.nchannels),
+                                                              dtype=np.float32)))
+            for i, m in enumerate(range(self.next, last + 1)):
+                at = m * hop - self.origin
+                self.ola[at:at + frame] += y[i].T
+            self.next = last + 1
+
+        out[:n] = self.ola[self.pos - self.origin:end - self.origin]
+        # keep the overlap-add tail of the frames already synthesized
+        used = end - self.origin
+        tail = max((self.next - 1) * hop + frame - end, 0)
+        self.ola[:tail] = self.ola[used:used + tail]
+        self.ola[tail:] = 0
+        self.origin = end
+        self.expected = end
+
+
+def benchmark(bank, chunk, seconds, fade):
+    """Renders seconds of audio in chunks of chunk frames as the audio callback does, at random levels. Every other
+    chunk changes the level: a reader of the new level is opened at the same position and the previous reader is also
+    read for fade frames (the crossfade). Returns the durations (in seconds) of the chunks without and with a change.
+    """
+    out = np.zeros((chunk, bank.nchannels), dtype=np.float32)
+    old = np.zeros((fade, bank.nchannels), dtype=np.float32)
+    numlevels = len(bank.levels.values)
+    durations = ([], [])
+    reader = None
+    for i in range(int(seconds * bank.framerate / chunk)):
+        change = i % 2
+        start = time.perf_counter()
+        if reader is None or reader.tell() >= reader.getnframes():
+            wavid = random.choice(bank.wavids)
+            reader = bank.open(random.randint(1, numlevels), wavid)
+        elif change:
+            previous = reader
+            reader = bank.open(random.randint(1, numlevels), wavid)
+            reader.setpos(previous.tell())
+            previous.read(old)
+        reader.read(out)
+        durations[change].append(time.perf_counter() - start)
+    return np.array(durations[0]), np.array(durations[1])
+
+
+def main(args=None):
+    parser = ConfigParser()
+    parser.read(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.ini'))
+
+    parser2 = argparse.ArgumentParser(prog='speechadjuster-dspbench', description='dsp.py (part of SpeechAdjuster tool): measures '
+                                      'offline the time the real-time rendering of the levels (levelmode = dsp) takes per audio chunk and '
+                                      'compares it with the duration of the chunk (parameter audiochunk in config.ini).')
+    parser2.add_argument('folder', type=str, help='Path to a folder of unprocessed .wav files. (type: string)')
+    parser2.add_argument('-f', '--feature', type=str, choices=features, action='append',
+                         help='Feature to measure, can be repeated. Default: all. The range of dspfeature is dspmin to dspmax in config.ini, '
+                              'the other features use -12 to 12. (type: string)')
+    parser2.add_argument('-s', '--seconds', type=float, default=60, help='Audio rendered per feature (in seconds). Default: 60. (type: float)')
+    parser2.add_argument('-b', '--budget', type=float, default=0.5,
+                         help='Fraction of the chunk duration the rendering may take, the rest is left to the mixing, the masker and '
+                              'the other processes. Default: 0.5. (type: float)')
+    parser2.add_argument('-r', '--rate', type=int,
+                         help='Sample rate (in Hz) the levels are rendered at, that of the output stream. Default: outputrate in config.ini, '
+                              'or the default rate of the audio device if it is 0 (48000 Hz without PyAudio). (type: integer)')
+    args = parser2.parse_args(args)
+
+    rate = args.rate or parser.getint('stimuli', 'outputrate', fallback=0)
+    if not rate:
+        try:
+            from backends import PyAudioBackend
+            device = PyAudioBackend()
+            rate = device.default_rate()
+            device.close()
+        except (ImportError, OSError):
+            rate = 48000
+    nchannels = parser.getint('stimuli', 'outputchannels', fallback=0) or None
+    audiochunk = parser.getfloat('stimuli', 'audiochunk', fallback=0.1)
+    fadelength = parser.getfloat('stimuli', 'fadelength', fallback=0.02)
+    numlevels = parser.getint('stimuli', 'dsplevels', fallback=25)
+    feature = parser.get('stimuli', 'dspfeature', fallback='gain')
+    ranges = {f: (-12., 12.) for f in features}
+    ranges[feature] = (parser.getfloat('stimuli', 'dspmin', fallback=-30), parser.getfloat('stimuli', 'dspmax', fallback=0))
+
+    try:
+        stimuli = load_stimuli(args.folder, '', numlevels)
+    except (OSError, ValueError) as error:
+        sys.exit('[ERROR] ' + str(error))
+
+    slow = False
+    for f in args.feature or features:
+        start = time.perf_counter()
+        bank = DspBank(stimuli, numlevels, stimuli.wavids, float('inf'), 'memory', f, *ranges[f], rate, nchannels)
+        setup = time.perf_counter() - start
+        chunk = int(audiochunk * bank.framerate)
+        deadline = chunk / bank.framerate
+        steady, changes = benchmark(bank, chunk, args.seconds, max(int(fadelength * bank.framerate), 1))
+        worst = max(np.percentile(steady, 99), np.percentile(changes, 99))
+        ok = worst <= args.budget * deadline
+        slow = slow or not ok
+        print(f + ' (' + str(numlevels) + ' levels, ' + str(bank.framerate) + ' Hz, chunk ' + str(chunk) + ' frames = '
+              + '%.1f' % (deadline * 1000) + ' ms, levels computed in ' + '%.1f' % (setup * 1000) + ' ms)')
+        for name, d in (('steady', steady), ('level change', changes)):
+            print('  %-13s mean %7.3f ms  p99 %7.3f ms  max %7.3f ms' % (name, d.mean() * 1000, np.percentile(d, 99) * 1000,
+                                                                       d.max() * 1000))
+        print('  p99 load ' + '%.3f' % (worst / deadline) + ' of the chunk (budget ' + str(args.budget) + '): '
+              + ('OK' if ok else 'TOO SLOW'))
+    return 1 if slow else 0
+
+if __name__ == "__main__":
+     sys.exit(main())
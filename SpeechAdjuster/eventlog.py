@@ -0,0 +1,138 @@
+#######################################################
+## Event log of a session: the pID_results.txt file
+## (read by results.py) and the pID_events.csv file.
+#######################################################
+#######################################################
+## Author: Olympia Simantiraki
+## License: GNU GPL v3
+## Version: v1.0.0
+## Email: olina.simantiraki@gmail.com
+#######################################################
+
+import csv
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+import numpy as np
+
+# event types
+TEXT = 0   # a line of text written by the UI
+LEVEL = 1  # level change heard by the listener
+INPUT = 2  # level asked for by an input event (knob or arrows); the inputs of one chunk are coalesced into one LEVEL
+
+names = {TEXT: 'text', LEVEL: 'level', INPUT: 'input'}
+
+record = np.dtype([('type', np.uint8), ('level', np.int32), ('position', np.int64), ('ns', np.int64)])
+
+
+class EventLog:
+    """The audio callback pushes fixed-size records (type, level, position in the output stream, time.monotonic_ns())
+        into a ring buffer and the UI pushes lines of text and input events into a queue; neither opens a file or formats
+        a date. A writer thread drains both every period, orders the events by time and appends them in one write to:
+          - filename (pID_results.txt), in the format of the previous versions: 'YYYY-mm-dd HH:MM:SS.fff   text'
+            with the UTC time, one line per event (level changes as 'level = N'; input events are not written)
+          - the .csv file next to it (pID_events.csv) with the columns ns, utc, type, level, position, text
+       filename: Path of the text file
+       size: Number of records of the ring buffer
+       period: Time (in seconds) between two drains by the writer thread
+       logger: Logger informed about dropped records
+    """
+
+    def __init__(self, filename, size=4096, period=0.1, logger=logging.getLogger(__name__)):
+        self.logger = logger
+        self.period = period
+        self.records = np.zeros(size, dtype=record)
+        self.pushed = 0  # records pushed by the audio callback (only the callback changes it)
+        self.read = 0    # records drained by the writer thread (only the writer changes it)
+        self.dropped = 0   # records dropped by the audio callback (only the callback changes it)
+        self.reported = 0  # dropped records already logged (only the writer changes it)
+
+        # the monotonic clock of the records is converted to UTC with the offset measured at the start
+        self.offset = time.time_ns() - time.monotonic_ns()
+
+        self._texts = queue.SimpleQueue()
+        self._stop = threading.Event()
+        self._txt = open(filename, 'a')
+        self._csv = open(filename.rsplit('_results.txt', 1)[0] + '_events.csv', 'a', newline='')
+        self._writer = csv.writer(self._csv)
+        if self._csv.tell() == 0:
+            self._writer.writerow(['ns', 'utc', 'type', 'level', 'position', 'text'])
+        self._thread = threading.Thread(target=self._run, name='eventlog', daemon=True)
+        self._thread.start()
+
+    def event(self, type, level, position):
+        """Called from the audio callback. If the writer has fallen behind by more than the ring buffer's length, the
+        record is dropped and counted.
+        """
+        size = len(self.records)
+        if self.pushed - self.read >= size:
+            self.dropped += 1
+            return
+        r = self.records[self.pushed % size]
+        r['type'] = type
+        r['level'] = level
+        r['position'] = position
+        r['ns'] = time.monotonic_ns()
+        self.pushed += 1
+
+    def write(self, text):
+        """Called from the UI. Adds a line of text with the current time.
+        """
+        self._texts.put((time.monotonic_ns(), TEXT, -1, text))
+
+    def input(self, level, ns):
+        """Called from the UI. Adds the level asked for by the input event handled at time.monotonic_ns() ns.
+        """
+        self._texts.put((ns, INPUT, level, None))
+
+    def close(self):
+        """Writes the pending events and closes the files.
+        """
+        self._stop.set()
+        self._thread.join()
+        self._txt.close()
+        self._csv.close()
+
+    def _drain(self):
+        size = len(self.records)
+        upto = self.pushed
+        events = []
+        while self.read < upto:
+            i = self.read % size
+            k = min(upto - self.read, size - i)
+            for r in self.records[i:i + k].tolist():
+                events.append((r[3], r[0], r[1], r[2], None))
+            self.read += k
+        while True:
+            try:
+                ns, type, level, text = self._texts.get_nowait()
+            except queue.Empty:
+                break
+            events.append((ns, type, level, -1, text))
+        if not events:
+            return
+
+        events.sort(key=lambda e: e[0])
+        lines = []
+        for ns, type, level, position, text in events:
+            if type == LEVEL:
+                text = 'level = ' + str(level)
+            utc = datetime.fromtimestamp((ns + self.offset) / 1e9, timezone.utc).strftime('%Y-%m-%d %H:%M:%S.%f')
+            if type != INPUT:
+                lines.append(utc[:-3] + '   ' + text + '\n')
+            self._writer.writerow([ns, utc, names[type], level, position, text or ''])
+        self._txt.write(''.join(lines))
+        self._txt.flush()
+        self._csv.flush()
+
+        dropped = self.dropped
+        if dropped > self.reported:
+            self.logger.warning("Event log: " + str(dropped - self.reported) + " events dropped")
+            self.reported = dropped
+
+    def _run(self):
+        while not self._stop.wait(self.period):
+            self._drain()
+        self._drain()
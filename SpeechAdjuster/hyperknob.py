@@ -64,6 +64,7 @@ class HyperKnob(Widget):
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        self.touched = False  # True while the value is set by a touch (for the latency measurement)
         self.bind(value = self._value)
         mindim = min(self.width, self.height)
         self.size = mindim * self.knob_radius, mindim * self.knob_radius
@@ -80,6 +81,13 @@ class HyperKnob(Widget):
         if self.disabled or not self.collide_point(*touch.pos):
             return
 
+        self.touched = True
+        try:
+            self._move(touch)
+        finally:
+            self.touched = False
+
+    def _move(self, touch):
         posx, posy = touch.pos
         cx, cy = self.center
         rx, ry = posx - cx, posy - cy
@@ -116,10 +124,9 @@ class HyperKnob(Widget):
                 self.value = self.minvalue
                 return
 
+        # the first multiple of the step (at least one step) not below the angle
         self._angle_step = 360 / (self.maxvalue - self.minvalue)
-        self._angle = self._angle_step
-        while self._angle < angle:
-            self._angle = self._angle + self._angle_step
+        self._angle = self._angle_step * max(math.ceil(angle / self._angle_step), 1)
 
         if (self.minangle <= 0) and (self.maxangle >= 0):
             if angle > 180:
@@ -0,0 +1,65 @@
+#######################################################
+## Control-to-sound latency of the level changes made
+## by the listener (knob, arrow buttons or keys).
+#######################################################
+#######################################################
+## Author: Olympia Simantiraki
+## License: GNU GPL v3
+## Version: v1.0.0
+## Email: olina.simantiraki@gmail.com
+#######################################################
+
+import csv
+import time
+import numpy as np
+
+percentiles = (50, 90, 95, 99, 100)
+
+
+class LatencyMeter:
+    """Measures the time from the input event that changed the level (time.monotonic_ns() when the UI handled it) to
+        the time the first sample of the new level reaches the DAC, i.e. time_info['output_buffer_dac_time'] of the
+        first chunk that carries it. The DAC time is in the clock of the stream; it is converted to the monotonic
+        clock with time_info['current_time'] measured in the same callback. Hosts that do not report these times
+        (both are 0) are given the output latency of the stream instead.
+       latency: Output latency (in seconds) of the stream
+       size: Maximum number of level changes measured in a session
+    """
+
+    def __init__(self, latency, size=65536):
+        self.latency = latency
+        self.levels = np.zeros(size, dtype=np.int32)
+        self.inputs = np.zeros(size, dtype=np.int64)
+        self.outputs = np.zeros(size, dtype=np.int64)
+        self.count = 0
+
+    def add(self, level, input_ns, time_info):
+        """Called from the audio callback filling the first chunk of the new level.
+        """
+        now = time.monotonic_ns()
+        dac, current = time_info.get('output_buffer_dac_time', 0), time_info.get('current_time', 0)
+        ahead = dac - current if dac and current else self.latency
+        if self.count < len(self.levels):
+            self.levels[self.count] = level
+            self.inputs[self.count] = input_ns
+            self.outputs[self.count] = now + int(ahead * 1e9)
+            self.count += 1
+
+    def save(self, name):
+        """Writes every measurement to name_latency.csv and the percentiles (in ms) to name_latency_percentiles.csv.
+        Returns the percentiles.
+        """
+        ms = (self.outputs[:self.count] - self.inputs[:self.count]) / 1e6
+        with open(name + '_latency.csv', 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['level', 'input_ns', 'output_ns', 'latency_ms'])
+            writer.writerows(zip(self.levels[:self.count].tolist(), self.inputs[:self.count].tolist(),
+                                 self.outputs[:self.count].tolist(), np.round(ms, 3).tolist()))
+
+        values = np.percentile(ms, percentiles) if self.count else [float('nan')] * len(percentiles)
+        with open(name + '_latency_percentiles.csv', 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['changes', 'mean_ms'] + ['p' + str(p) + '_ms' for p in percentiles])
+            writer.writerow([self.count, '%.3f' % (ms.mean() if self.count else float('nan'))]
+                            + ['%.3f' % v for v in values])
+        return dict(zip(percentiles, values))
@@ -0,0 +1,185 @@
+#######################################################
+## Manifest of a target speech folder: its levels, the
+## filenames and the .wav headers, cached between launches.
+#######################################################
+#######################################################
+## Author: Olympia Simantiraki
+## License: GNU GPL v3
+## Version: v1.0.0
+## Email: olina.simantiraki@gmail.com
+#######################################################
+
+import os
+import re
+import json
+import hashlib
+
+from wavfile import read_header, WavHeader
+import pack
+
+VERSION = 1
+
+# the manifests are cached outside the stimulus folders, so that writing them does not change the folders' mtimes
+cachedir = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+                        'speechadjuster', 'manifests')
+
+
+class Manifest:
+    """Levels (prefix1..prefixN), .wav filenames and headers of a target speech folder.
+       path: Path to the target speech folder
+       prefix: Prefix of the levels' folders
+       mtimes: Modification times (ns) of the folder and of its levels' folders, the key of the cached manifest
+       headers: headers[level - 1][wavid] is the WavHeader of the stimulus wavid at the given level
+    """
+
+    def __init__(self, path, prefix, mtimes, headers):
+        self.path = path
+        self.prefix = prefix
+        self.mtimes = mtimes
+        self.headers = headers
+        self.numlevels = len(headers)
+        self.wavids = sorted(headers[0])
+
+    def header(self, level, wavid):
+        return self.headers[level - 1][wavid]
+
+    def todict(self):
+        return {'version': VERSION, 'path': os.path.abspath(self.path), 'prefix': self.prefix, 'mtimes': self.mtimes,
+                'levels': [{w: list(h) for w, h in level.items()} for level in self.headers]}
+
+
+class Sources:
+    """Unprocessed .wav files of a target speech folder whose levels are rendered while they are played (parameter
+        levelmode = dsp, see dsp.py). Every level has the headers of these files.
+       path: Path to the folder
+       numlevels: Number of levels
+       headers: headers[wavid] is the WavHeader of the file wavid
+    """
+
+    def __init__(self, path, numlevels, headers):
+        self.path = path
+        self.prefix = ''
+        self.numlevels = numlevels
+        self.headers = headers
+        self.wavids = sorted(headers)
+
+    def header(self, level, wavid):
+        return self.headers[wavid]
+
+
+def sources(path, numlevels):
+    """Scans the .wav files of path and checks that they all have the same sample rate, sample width and number of channels.
+    """
+    with os.scandir(path) as entries:
+        headers = {entry.name: read_header(entry.path) for entry in entries
+                   if entry.name.endswith('.wav') and entry.is_file()}
+    if not headers:
+        raise ValueError('The directory ' + path + ' does not contain .wav files. With levelmode = dsp, the target speech '
+                         'folders should contain the unprocessed .wav files.')
+
+    first = min(headers)
+    for wavid, header in headers.items():
+        if header[:3] != headers[first][:3]:
+            raise ValueError('The file ' + os.path.join(path, wavid) + ' has (channels, sample width, rate) '
+                             + str(tuple(header[:3])) + ' while ' + os.path.join(path, first) + ' has '
+                             + str(tuple(headers[first][:3])) + '. All the stimuli should have the same format.')
+    return Sources(path, numlevels, headers)
+
+
+def _cachefile(path, prefix):
+    key = hashlib.sha1((os.path.abspath(path) + '\0' + prefix).encode('utf-8')).hexdigest()
+    return os.path.join(cachedir, key + '.json')
+
+
+def _mtimes(path, prefix, numlevels):
+    mtimes = {'': os.stat(path).st_mtime_ns}
+    for i in range(1, numlevels + 1):
+        mtimes[prefix + str(i)] = os.stat(os.path.join(path, prefix + str(i))).st_mtime_ns
+    return mtimes
+
+
+def build(path, prefix):
+    """Scans path once and checks that it contains only the levels prefix1..prefixN, each with the same .wav
+    filenames, and that all the .wav files have the same sample rate, sample width and number of channels.
+    """
+    levels = {}
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if not entry.is_dir() or entry.name.startswith('.'):
+                continue
+            m = re.fullmatch(re.escape(prefix) + r'(\d+)', entry.name)
+            if not m:
+                raise ValueError('In the directory ' + path + ' only the folders with the target speech stimuli should exist '
+                                 'starting with the prefix ' + prefix + ' (found ' + entry.name + ').')
+            levels[int(m.group(1))] = entry.path
+
+    if len(levels) < 2:
+        raise ValueError('More than one levels/folders should exist in ' + path + '.')
+
+    headers = []
+    for i in range(1, len(levels) + 1):
+        if i not in levels:
+            raise ValueError('The folder ' + os.path.join(path, prefix + str(i)) + ' does not exist. All the folders with '
+                             'integer IDs from 1 to the maximum number of levels with step 1 should exist.')
+        with os.scandir(levels[i]) as entries:
+            headers.append({entry.name: read_header(entry.path) for entry in entries
+                            if entry.name.endswith('.wav') and entry.is_file()})
+        if not headers[-1]:
+            raise ValueError('The directory ' + levels[i] + ' does not contain .wav files.')
+        if headers[-1].keys() != headers[0].keys():
+            raise ValueError('All the levels/folders in the same directory should contain .wav files with the same filenames. '
+                             'Different files in ' + levels[1] + ' and ' + levels[i] + ': '
+                             + str(sorted(set(headers[0]) ^ set(headers[-1]))))
+
+    first = min(headers[0])
+    params = headers[0][first][:3]
+    for i, level in enumerate(headers):
+        for wavid, header in level.items():
+            if header[:3] != params:
+                raise ValueError('The file ' + os.path.join(levels[i + 1], wavid) + ' has (channels, sample width, rate) '
+                                 + str(tuple(header[:3])) + ' while ' + os.path.join(levels[1], first) + ' has '
+                                 + str(tuple(params)) + '. All the stimuli should have the same format.')
+
+    return Manifest(path, prefix, _mtimes(path, prefix, len(levels)), headers)
+
+
+def load(path, prefix):
+    """Returns the manifest of path from the cache if the modification times of the folder and of its levels' folders
+    have not changed since it was built, otherwise builds and caches it. Files overwritten in place (without being
+    removed or renamed) do not change the folders' mtimes and are not detected.
+    """
+    cachefile = _cachefile(path, prefix)
+    try:
+        with open(cachefile) as f:
+            cached = json.load(f)
+        if cached['version'] == VERSION and cached['prefix'] == prefix:
+            headers = [{w: WavHeader(*h) for w, h in level.items()} for level in cached['levels']]
+            if _mtimes(path, prefix, len(headers)) == cached['mtimes']:
+                return Manifest(path, prefix, cached['mtimes'], headers)
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    manifest = build(path, prefix)
+    try:
+        os.makedirs(cachedir, exist_ok=True)
+        with open(cachefile + '.tmp', 'w') as f:
+            json.dump(manifest.todict(), f)
+        os.replace(cachefile + '.tmp', cachefile)
+    except OSError:
+        pass  # the manifest is then built again on the next launch
+    return manifest
+
+
+def load_stimuli(path, prefix, levels=None):
+    """Returns the index (levels, filenames and headers) of a target speech folder (its Manifest)
+    or of a stimulus archive (a pack.Archive). If levels is given, path is a folder of unprocessed stimuli
+    rendered at that number of levels (its Sources).
+    """
+    if levels:
+        if pack.is_archive(path):
+            raise ValueError(path + ' is a stimulus archive. With levelmode = dsp, the target speech should be a folder '
+                             'of unprocessed .wav files.')
+        return sources(path, levels)
+    if pack.is_archive(path):
+        return pack.Archive(path)
+    return load(path, prefix)
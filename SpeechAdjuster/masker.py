@@ -0,0 +1,66 @@
+#######################################################
+## Masker of the SpeechAdjuster tool, decoded once and
+## played in a loop from memory.
+#######################################################
+#######################################################
+## Author: Olympia Simantiraki
+## License: GNU GPL v3
+## Version: v1.0.0
+## Email: olina.simantiraki@gmail.com
+#######################################################
+
+import wave
+import numpy as np
+
+from stimulusbank import read_wave
+from resample import convert
+from crossfade import ramps
+
+
+class Masker:
+    """Plays the masker as a circular buffer. The loop point is crossfaded: the last fade seconds of the masker are
+        faded out over its first fade seconds, which are faded in, and the buffer is that much shorter, so going from
+        its end to its beginning continues the signal without a gap or a click. read() only copies samples, it can be
+        called from the audio callback.
+        The masker is converted to the format of the output stream when it is loaded (see resample.py).
+       path: Path of the masker's .wav file
+       fade: Length (in seconds) of the crossfade of the loop point
+       rate, nchannels: Format of the output stream; the file's format if None
+    """
+
+    def __init__(self, path, fade, rate=None, nchannels=None):
+        with wave.open(path, 'rb') as wf:
+            self.rate = rate or wf.getframerate()
+            self.nchannels = nchannels or wf.getnchannels()
+            self.sampwidth = wf.getsampwidth()
+            samples = np.zeros((wf.getnframes(), wf.getnchannels()), dtype=np.float32)
+            read_wave(wf, samples)
+            samples = convert(samples, wf.getframerate(), self.rate, self.nchannels)
+        if len(samples) < 2:
+            raise ValueError('The masker file ' + path + ' is too short to be played in a loop.')
+
+        # equal power: the two ends of the masker are uncorrelated
+        frames = min(max(int(fade * self.rate), 1), len(samples) // 2)
+        fade_in, fade_out = ramps(self.rate, frames / self.rate, 'equalpower')
+        frames = len(fade_in)
+        self.loop = samples[:len(samples) - frames].copy()
+        self.loop[:frames] = samples[:frames] * fade_in + samples[len(samples) - frames:] * fade_out
+        self.pos = 0
+
+    def __len__(self):
+        return len(self.loop)
+
+    def start(self, offset=0):
+        """The next read starts at frame offset of the loop.
+        """
+        self.pos = int(offset) % len(self.loop)
+
+    def read(self, out):
+        """Copies the next len(out) frames of the loop into out.
+        """
+        n, done = len(out), 0
+        while done < n:
+            k = min(n - done, len(self.loop) - self.pos)
+            out[done:done + k] = self.loop[self.pos:self.pos + k]
+            self.pos = (self.pos + k) % len(self.loop)
+            done += k
@@ -0,0 +1,149 @@
+#######################################################
+## This script packs a target speech folder (all its
+## levels) into one stimulus archive (.sapack) that can
+## be passed to speechadjuster -a/-t instead of the folder.
+#######################################################
+#######################################################
+## Author: Olympia Simantiraki
+## License: GNU GPL v3
+## Version: v1.0.0
+## Email: olina.simantiraki@gmail.com
+#######################################################
+
+## Archive layout:
+##   magic (8 bytes) | length of the index (uint64, little endian) | index (JSON, utf-8) | payloads
+## The payloads start at the first multiple of 16 after the index and every payload is aligned to 16 bytes.
+## The index maps (level, filename) to the offset (relative to the first payload), length (in bytes), rate, sample
+## width, channels and frames of the PCM samples. Files with identical samples and format share one payload.
+
+import sys
+import os
+import json
+import struct
+import hashlib
+import argparse
+from configparser import ConfigParser
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from wavfile import WavHeader
+import manifest
+
+MAGIC = b'SAPACK1\0'
+EXTENSION = '.sapack'
+ALIGN = 16
+
+
+def is_archive(path):
+    """True if path is a stimulus archive rather than a folder.
+    """
+    return os.path.isfile(path)
+
+
+def _aligned(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+class Archive:
+    """Index of a stimulus archive.
+       path: Path to the .sapack file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            head = f.read(16)
+            if len(head) < 16 or head[:8] != MAGIC:
+                raise ValueError('The file ' + path + ' is not a stimulus archive.')
+            length = struct.unpack('<Q', head[8:])[0]
+            index = json.loads(f.read(length).decode('utf-8'))
+
+        self.base = _aligned(16 + length)
+        self.prefix = index['prefix']
+        self.numlevels = index['numlevels']
+        self.wavids = index['wavids']
+        self.entries = {}
+        for e in index['entries']:
+            self.entries[(e['level'], e['file'])] = WavHeader(e['channels'], e['width'], e['rate'], e['frames'],
+                                                              self.base + e['offset'])
+
+    def header(self, level, wavid):
+        """Header of the stimulus wavid at the given level; its offset is the position of the samples in the archive.
+        """
+        return self.entries[(level, wavid)]
+
+
+def pack(folder, prefix, output):
+    """Packs the levels of folder into the archive output. Returns the number of entries and of distinct payloads.
+    """
+    stimuli = manifest.load(folder, prefix)
+    numlevels, wavids = stimuli.numlevels, stimuli.wavids
+
+    # first pass: hash the samples to find identical payloads
+    entries = []
+    payloads = []  # (path, offset in the .wav file, length)
+    seen = {}
+    size = 0
+    for level in range(1, numlevels + 1):
+        for wavid in wavids:
+            path = os.path.join(folder, prefix + str(level), wavid)
+            header = stimuli.header(level, wavid)
+            length = header.nframes * header.nchannels * header.sampwidth
+
+            digest = hashlib.sha1(struct.pack('<HHI', header.nchannels, header.sampwidth, header.framerate))
+            with open(path, 'rb') as f:
+                f.seek(header.offset)
+                remaining = length
+                while remaining > 0:
+                    block = f.read(min(remaining, 2**20))
+                    digest.update(block)
+                    remaining -= len(block)
+            key = digest.digest()
+
+            if key not in seen:
+                seen[key] = size
+                payloads.append((path, header.offset, length))
+                size = _aligned(size + length)
+
+            entries.append({'level': level, 'file': wavid, 'offset': seen[key], 'length': length,
+                            'rate': header.framerate, 'width': header.sampwidth, 'channels': header.nchannels,
+                            'frames': header.nframes})
+
+    index = json.dumps({'prefix': prefix, 'numlevels': numlevels, 'wavids': wavids, 'entries': entries}).encode('utf-8')
+
+    # second pass: write the index and the distinct payloads
+    with open(output, 'wb') as out:
+        out.write(MAGIC + struct.pack('<Q', len(index)) + index)
+        out.write(b'\0' * (_aligned(out.tell()) - out.tell()))
+        for path, offset, length in payloads:
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                out.write(f.read(length))
+            out.write(b'\0' * (_aligned(length) - length))
+
+    return len(entries), len(payloads)
+
+
+def main(args=None):
+    parser = ConfigParser()
+    parser.read(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.ini'))
+
+    parser2 = argparse.ArgumentParser(prog='speechadjuster-pack', description='pack.py (part of SpeechAdjuster tool): packs a target '
+                                      'speech folder (e.g. stimuli/examples/tilt/adjustment/) with all its levels into one stimulus archive. '
+                                      'The archive can be passed to speechadjuster with -a or -t instead of the folder.')
+    parser2.add_argument('folder', type=str, help='Path to the target speech folder. (type: string)')
+    parser2.add_argument('-o', '--output', type=str, help='Path of the archive. Default: the folder path with the extension ' + EXTENSION + '. (type: string)')
+    parser2.add_argument('-p', '--prefix', type=str, default=parser.get('stimuli', 'prefix', fallback='level_'),
+                         help='Prefix of the levels\' folders. Default: prefix in config.ini. (type: string)')
+    args = parser2.parse_args(args)
+
+    output = args.output or os.path.normpath(args.folder) + EXTENSION
+    try:
+        numentries, numpayloads = pack(args.folder, args.prefix, output)
+    except ValueError as error:
+        sys.exit('[ERROR] ' + str(error))
+
+    print(output + ': ' + str(numentries) + ' stimuli, ' + str(numpayloads) + ' distinct, '
+          + '%.1f' % (os.path.getsize(output) / 2**20) + ' MB')
+
+if __name__ == "__main__":
+     sys.exit(main())
@@ -0,0 +1,213 @@
+#######################################################
+## Plots of the results: rendering of the figures,
+## cached and spread over worker processes.
+#######################################################
+#######################################################
+## Author: Olympia Simantiraki
+## License: GNU GPL v3
+## Version: v1.0.0
+## Email: olina.simantiraki@gmail.com
+#######################################################
+
+## A plot is a job (renderer, filename, data, params): the name of one of the renderers below, the .pdf file, the
+## DataFrame slice it is drawn from and the other values it depends on (levels, button_on, labels; JSON types only).
+## The key of a job is a hash of all of them. The keys of the rendered files are kept in plots/plotcache.json and a file
+## is rendered again only if its key has changed or it does not exist.
+
+import os
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.collections import LineCollection
+from matplotlib.lines import Line2D
+from matplotlib.artist import setp
+from matplotlib import colors
+
+VERSION = 2
+CACHE = 'plotcache.json'
+ANNOTATIONS = 2500  # maximum number of cells of a heatmap annotated with their value
+
+cdict = {'red':   ((0.0, 0.0, 0.0),
+                   (0.5, 0.0, 1.0),
+                   (1.0, 0.1, 1.0)),
+
+         'green': ((0.0, 0.0, 0.0),
+                   (1.0, 0.0, 0.0)),
+
+         'blue':  ((0.0, 0.0, 0.1),
+                   (0.5, 1.0, 0.0),
+                   (1.0, 0.0, 0.0))
+        }
+
+cmap = colors.LinearSegmentedColormap('custom', cdict)
+
+
+def adjustments(data, params, filename):
+    """Level adjustments of one participant in one block: the changes of every trial (data: trial, time, level) as one
+        line collection and one set of markers.
+       params: block, trials (values of the column trial, in the order of the legend), labels (legend), higherlevel,
+        lowerlevel, button_on
+    """
+    fig1 = Figure(figsize=(5, 5), dpi=200)
+    canvas = FigureCanvasAgg(fig1)
+    ax = fig1.add_subplot(111)
+
+    ntrials = len(params['trials'])
+    palette = cmap(np.linspace(1, 254, ntrials).astype(int)) if ntrials else np.zeros((0, 4))
+    order = {t: i for i, t in enumerate(params['trials'])}
+    trial = data['trial'].map(order).to_numpy()
+    points = data[['time', 'level']].to_numpy(dtype=float)
+    sort = np.argsort(trial, kind='stable')
+    trial, points = trial[sort], points[sort]
+    bounds = np.searchsorted(trial, np.arange(ntrials + 1))
+    segments = [points[bounds[i]:bounds[i + 1]] for i in range(ntrials)]
+
+    ax.add_collection(LineCollection(segments, colors=palette, linewidths=.5))
+    ax.scatter(points[:, 0], points[:, 1], s=12, c=palette[trial] if len(trial) else None, zorder=2)
+    ax.autoscale_view()
+
+    ax.axis(ymax=params['higherlevel'] + 1, ymin=params['lowerlevel'] - 1)
+    ax.set_ylabel('Adjustments')
+    ax.set_xlabel('Time (sec)')
+    ax.set_title('Block ' + str(params['block']))
+    ax.vlines(params['button_on'], ymax=params['higherlevel'] + 1, ymin=params['lowerlevel'] - 1, color='grey', linestyle='--')
+    fig1.legend([Line2D([], [], color=c, marker='o', linewidth=.5) for c in palette], params['labels'],
+                title="trial no")
+    fig1.savefig(filename)
+
+
+def histogram(data, params, filename):
+    """Histogram of the preferred levels (data: pref_level) of all participants in one block.
+       params: block, higherlevel, lowerlevel
+    """
+    fig2 = Figure(figsize=(5, 5), dpi=200)
+    canvas = FigureCanvasAgg(fig2)
+    ax2 = fig2.add_subplot(111)
+    ax2.hist(data['pref_level'])
+    ax2.axis(xmax=params['higherlevel'] + 1, xmin=params['lowerlevel'] - 1)
+    ax2.set_ylabel('Frequency')
+    ax2.set_xlabel('Available options (levels)')
+    ax2.set_title('Block ' + str(params['block']))
+    fig2.savefig(filename)
+
+
+def boxplots(data, params, filename):
+    """One boxplot of params['column'] per block (data: block and the column).
+       params: column, ylabel, hlines (y of the dashed lines), ylim (or None)
+    """
+    fig3 = Figure(figsize=(5, 5), dpi=200)
+    canvas = FigureCanvasAgg(fig3)
+    ax3 = fig3.add_subplot(111)
+    blocks = range(1, int(data['block'].max()) + 1)
+    ax3.boxplot([data.loc[data['block'] == i, params['column']].to_numpy() for i in blocks], positions=list(blocks))
+    ax3.set_ylabel(params['ylabel'])
+    ax3.set_xlabel('Block')
+    for y in params['hlines']:
+        ax3.axhline(y=y, color='grey', linestyle='--')
+    if params['ylim'] is not None:
+        ax3.axis(ymin=params['ylim'][0], ymax=params['ylim'][1])
+    ax3.set_xticks(list(blocks))
+    ax3.set_xticklabels([str(i) for i in blocks])
+    ax3.set_xlim(0, len(blocks) + 1)
+    fig3.savefig(filename)
+
+
+def heatmap(data, params, filename):
+    """Preferred level of every participant (rows) for every stimulus of the test phase (columns) in one block
+        (data: pID, target_audio, pref_level). The values are written in the cells up to ANNOTATIONS cells.
+    """
+    fig6 = Figure(figsize=(10, 10), dpi=200)
+    canvas = FigureCanvasAgg(fig6)
+    ax_main = fig6.add_subplot(111)
+
+    p_id = data["pID"].unique()
+    wavfs = data["target_audio"].unique()
+    # the last preference of every participant for every stimulus, -1 where there is none; the table is sorted by
+    # pivot_table and put back in the order of appearance
+    prefs = data.pivot_table(index='pID', columns='target_audio', values='pref_level', aggfunc='last')
+    prefs = prefs.reindex(index=p_id, columns=wavfs).fillna(-1)
+    all_prefs = prefs.to_numpy(dtype=data['pref_level'].dtype if pd.api.types.is_integer_dtype(data['pref_level']) else float)
+    im = ax_main.imshow(all_prefs, cmap='Greens')
+
+    # one text per cell is the slowest part of the figure and unreadable on large matrices
+    if all_prefs.size <= ANNOTATIONS:
+        for (pts, j), value in np.ndenumerate(all_prefs):
+            ax_main.text(j, pts, value, ha="center", va="center", color="black", fontweight='bold')
+
+    ax_main.set_xticks(np.arange(len(wavfs)))
+    ax_main.set_xticklabels(wavfs)
+    ax_main.set_yticks(np.arange(len(p_id)))
+    ax_main.set_yticklabels(p_id)
+    ax_main.set_ylabel('Participant ID')
+    ax_main.set_xlabel('Stimulus')
+    setp(ax_main.get_xticklabels(), rotation=45, ha="right", rotation_mode="anchor")
+    setp(ax_main.get_yticklabels(), rotation=45, ha="right", rotation_mode="anchor")
+    fig6.savefig(filename)
+
+
+renderers = {'adjustments': adjustments, 'histogram': histogram, 'boxplots': boxplots, 'heatmap': heatmap}
+
+
+def key(job):
+    """Hash of a job: renderer, filename, data (values and column names) and params.
+    """
+    renderer, filename, data, params = job
+    digest = hashlib.sha1(json.dumps([VERSION, renderer, os.path.basename(filename), list(map(str, data.columns)), params],
+                                     sort_keys=True).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _render(job):
+    renderer, filename, data, params = job
+    renderers[renderer](data, params, filename)
+    return filename
+
+
+def render(jobs, folder, workers=None, logger=None):
+    """Renders the jobs whose files do not exist or whose key has changed, across workers processes (default: the number
+    of CPUs). Returns the number of files rendered.
+    """
+    cachefile = os.path.join(folder, CACHE)
+    try:
+        with open(cachefile) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+
+    rendered = 0
+    todo = []
+    for job in jobs:
+        k = key(job)
+        name = os.path.basename(job[1])
+        if cache.get(name) != k or not os.path.exists(job[1]):
+            todo.append((job, k))
+
+    if len(todo) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [(pool.submit(_render, job), job, k) for job, k in todo]
+            for future, job, k in futures:
+                try:
+                    future.result()
+                    cache[os.path.basename(job[1])] = k
+                    rendered += 1
+                except Exception as error:
+                    if logger is not None:
+                        logger.error("Plot " + job[1] + ": " + repr(error))
+    else:
+        for job, k in todo:
+            _render(job)
+            cache[os.path.basename(job[1])] = k
+            rendered += 1
+
+    if todo:
+        with open(cachefile + '.tmp', 'w') as f:
+            json.dump(cache, f, indent=1, sort_keys=True)
+        os.replace(cachefile + '.tmp', cachefile)
+    if logger is not None:
+        logger.info("Plots: " + str(rendered) + " rendered, " + str(len(jobs) - len(todo)) + " unchanged.")
+    return rendered
@@ -0,0 +1,62 @@
+#######################################################
+## Background loading of the stimuli needed next (the
+## next block's banks, the next sentences).
+#######################################################
+#######################################################
+## Author: Olympia Simantiraki
+## License: GNU GPL v3
+## Version: v1.0.0
+## Email: olina.simantiraki@gmail.com
+#######################################################
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Prefetcher:
+    """Runs loading jobs in one background thread, in the order they are submitted, while the participant reads the
+        instructions or waits for the next sentence. A job submitted with a key is collected with result(key, ...),
+        which waits for it if it is still running (or runs it if it was never submitted) and raises its exception.
+        The exceptions of the other jobs are only logged: they load what would otherwise be loaded when it is played.
+       logger: Logger informed about the jobs that failed
+    """
+
+    def __init__(self, logger=logging.getLogger(__name__)):
+        self.logger = logger
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='prefetch')
+        self.futures = {}
+        self.pending = set()  # jobs without a key, until they are done
+
+    def submit(self, key, fn, *args):
+        """Runs fn(*args) in the background thread. A job with the key of a job not collected yet is not submitted again.
+        """
+        if key is not None:
+            if key in self.futures:
+                return
+            self.futures[key] = self.executor.submit(fn, *args)
+        else:
+            future = self.executor.submit(fn, *args)
+            self.pending.add(future)
+            future.add_done_callback(self._done)
+
+    def result(self, key, fn, *args):
+        """Returns the result of the job key, or of fn(*args) run now if it was not submitted.
+        """
+        future = self.futures.pop(key, None)
+        if future is None:
+            return fn(*args)
+        return future.result()
+
+    def _done(self, future):
+        self.pending.discard(future)
+        if not future.cancelled() and future.exception() is not None:
+            self.logger.warning("Prefetching failed: " + repr(future.exception()))
+
+    def close(self):
+        """Cancels the jobs that have not started and returns without waiting for the running one.
+        """
+        # cancelled one by one, shutdown(cancel_futures=True) needs Python 3.9
+        for future in list(self.futures.values()) + list(self.pending):
+            future.cancel()
+        self.futures.clear()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,125 @@
+#######################################################
+## Recording of the target speech heard during the
+## adjustment phase (parameter saveaudio).
+#######################################################
+#######################################################
+## Author: Olympia Simantiraki
+## License: GNU GPL v3
+## Version: v1.0.0
+## Email: olina.simantiraki@gmail.com
+#######################################################
+
+import logging
+import queue
+import threading
+import wave
+import numpy as np
+
+from stimulusbank import to_pcm
+
+
+class Recorder:
+    """The audio callback pushes the samples into a ring buffer of fixed size and a writer thread streams them to
+        .wav files. Files are opened and closed with commands that carry the numbers of frames pushed and dropped at the
+        time they were given, so each file gets exactly the frames pushed between its open() and close() and its log line
+        the frames dropped meanwhile.
+       rate, nchannels, sampwidth: Format of the .wav files
+       seconds: Length (in seconds) of the ring buffer
+       period: Time (in seconds) between two drains of the ring buffer by the writer thread
+       logger: Logger informed about the saved files
+    """
+
+    def __init__(self, rate, nchannels, sampwidth, seconds=10, period=0.1, logger=logging.getLogger(__name__)):
+        self.logger = logger
+        self.rate = rate
+        self.nchannels = nchannels
+        self.sampwidth = sampwidth
+        self.period = period
+        self.ring = np.zeros((int(seconds * rate), nchannels), dtype=np.float32)
+        self.pushed = 0  # frames pushed by the audio callback (only the callback changes it)
+        self.read = 0    # frames drained by the writer thread (only the writer changes it)
+        self.dropped = 0   # frames dropped by the audio callback (only the callback changes it)
+        self.opened = 0    # frames dropped before the current file was opened (only the writer changes it)
+
+        self._commands = queue.SimpleQueue()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='recorder', daemon=True)
+        self._thread.start()
+
+    def push(self, samples):
+        """Called from the audio callback. Copies samples into the ring buffer; if the writer has fallen behind by
+        more than the ring buffer's length, the samples are dropped and counted.
+        """
+        n = len(samples)
+        size = len(self.ring)
+        if self.pushed + n - self.read > size:
+            self.dropped += n
+            return
+
+        i = self.pushed % size
+        k = min(n, size - i)
+        self.ring[i:i + k] = samples[:k]
+        self.ring[:n - k] = samples[k:]
+        self.pushed += n
+
+    def open(self, filename):
+        """The frames pushed from now on are written to filename.
+        """
+        self._commands.put(('open', filename, self.pushed, self.dropped))
+        self._wake.set()
+
+    def close(self):
+        """Closes the current file after the frames pushed so far. It does not block, so it can be called from the audio callback.
+        """
+        self._commands.put(('close', None, self.pushed, self.dropped))
+        self._wake.set()
+
+    def stop(self):
+        """Closes the current file and waits for the writer thread to finish.
+        """
+        self._commands.put(('stop', None, self.pushed, self.dropped))
+        self._wake.set()
+        self._thread.join()
+
+    def _drain(self, upto, wf):
+        size = len(self.ring)
+        while self.read < upto:
+            i = self.read % size
+            k = min(upto - self.read, size - i)
+            if wf is not None:
+                wf.writeframes(to_pcm(self.ring[i:i + k], self.sampwidth).tobytes())
+            self.read += k
+
+    def _run(self):
+        wf = None
+        filename = None
+        while True:
+            self._wake.wait(self.period)
+            self._wake.clear()
+            # frames pushed before the commands are read: a command given after this point has at >= upto, so the
+            # frames drained below all belong to the file of the last command read
+            upto = self.pushed
+
+            while True:
+                try:
+                    command, arg, at, dropped = self._commands.get_nowait()
+                except queue.Empty:
+                    break
+
+                self._drain(at, wf)
+                if wf is not None:
+                    wf.close()
+                    self.logger.info("Recording saved: " + filename + " (" + str(dropped - self.opened) + " frames dropped)")
+                    wf = None
+
+                if command == 'open':
+                    filename = arg
+                    self.opened = dropped
+                    wf = wave.open(filename, 'wb')
+                    wf.setframerate(self.rate)
+                    wf.setsampwidth(self.sampwidth)
+                    wf.setnchannels(self.nchannels)
+                elif command == 'stop':
+                    return
+
+            self._drain(upto, wf)
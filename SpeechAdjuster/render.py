@@ -0,0 +1,180 @@
+#######################################################
+## This script renders the levels of a target speech
+## folder (prefix1..prefixN) from unprocessed .wav files
+## with the processing of dsp.py.
+#######################################################
+#######################################################
+## Author: Olympia Simantiraki
+## License: GNU GPL v3
+## Version: v1.0.0
+## Email: olina.simantiraki@gmail.com
+#######################################################
+
+## Output layout (the target speech folder passed to speechadjuster -a/-t):
+##   <prefix>1 .. <prefix>N/<file>.wav   every source file rendered at every level, in the format of the source
+##   levels.csv                          level, feature, value, unit of every level; results.py's pref_level
+##                                       (and starting_level) join on its column level
+##   .render.json                        key of every rendered file (source size and mtime, feature, value)
+## A file whose key has not changed since the previous rendering and that still exists is not rendered again.
+
+import sys
+import os
+import csv
+import json
+import wave
+import hashlib
+import argparse
+from configparser import ConfigParser
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from manifest import load_stimuli
+from stimulusbank import to_pcm
+import dsp
+
+VERSION = 1
+STATE = '.render.json'
+LEVELS = 'levels.csv'
+
+# bank of the sources of each worker process, keyed by (source, feature, low, high, numlevels)
+_banks = {}
+
+
+def key(source, wavid, feature, value):
+    stat = os.stat(os.path.join(source, wavid))
+    return hashlib.sha1(json.dumps([VERSION, dsp.VERSION, wavid, stat.st_size, stat.st_mtime_ns, feature, value]).encode('utf-8')).hexdigest()
+
+
+def render_level(source, output, prefix, feature, low, high, numlevels, level, wavids):
+    """Renders the files wavids of source at the given level into output/prefixN. Runs in the worker processes.
+    """
+    params = (source, feature, low, high, numlevels)
+    if params not in _banks:
+        stimuli = load_stimuli(source, prefix, numlevels)
+        _banks.clear()
+        _banks[params] = dsp.DspBank(stimuli, numlevels, stimuli.wavids, float('inf'), 'mmap', feature, low, high)
+    bank = _banks[params]
+
+    folder = os.path.join(output, prefix + str(level))
+    os.makedirs(folder, exist_ok=True)
+    for wavid in wavids:
+        reader = bank.open(level, wavid)
+        out = np.zeros((reader.getnframes(), bank.nchannels), dtype=np.float32)
+        reader.read(out)
+        filename = os.path.join(folder, wavid)
+        with wave.open(filename + '.tmp', 'wb') as wf:
+            wf.setnchannels(bank.nchannels)
+            wf.setsampwidth(bank.sampwidth)
+            wf.setframerate(bank.framerate)
+            wf.writeframes(to_pcm(out, bank.sampwidth).tobytes())
+        os.replace(filename + '.tmp', filename)
+    return level, wavids
+
+
+def render(source, output, prefix, feature, low, high, numlevels, workers=None):
+    """Renders the files of source at numlevels levels of feature (from low to high) into output, across workers
+    processes. Returns the number of files rendered and of files unchanged.
+    """
+    stimuli = load_stimuli(source, prefix, numlevels)
+    values = dsp.Levels(feature, low, high, numlevels, stimuli.header(1, stimuli.wavids[0]).framerate).values
+
+    os.makedirs(output, exist_ok=True)
+    with os.scandir(output) as entries:
+        for entry in entries:
+            if entry.is_dir() and entry.name.startswith(prefix) and entry.name[len(prefix):].isdigit() \
+                    and not 1 <= int(entry.name[len(prefix):]) <= numlevels:
+                raise ValueError('The directory ' + output + ' contains ' + entry.name + ', which is not one of the ' + str(numlevels)
+                                 + ' levels rendered. Remove it or render into another directory.')
+
+    statefile = os.path.join(output, STATE)
+    try:
+        with open(statefile) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+
+    keys = {}
+    todo = {}
+    for level in range(1, numlevels + 1):
+        for wavid in stimuli.wavids:
+            name = prefix + str(level) + '/' + wavid
+            keys[name] = key(source, wavid, feature, float(values[level - 1]))
+            if state.get(name) != keys[name] or not os.path.exists(os.path.join(output, name)):
+                todo.setdefault(level, []).append(wavid)
+
+    rendered = 0
+    tasks = [(source, output, prefix, feature, low, high, numlevels, level, wavids) for level, wavids in todo.items()]
+    try:
+        if len(tasks) > 1 and workers != 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = [pool.submit(render_level, *task) for task in tasks]
+                for future in results:
+                    level, wavids = future.result()
+                    for wavid in wavids:
+                        name = prefix + str(level) + '/' + wavid
+                        state[name] = keys[name]
+                    rendered += len(wavids)
+        else:
+            for task in tasks:
+                level, wavids = render_level(*task)
+                for wavid in wavids:
+                    name = prefix + str(level) + '/' + wavid
+                    state[name] = keys[name]
+                rendered += len(wavids)
+    finally:
+        # the files rendered so far are kept if a level fails
+        state = {name: k for name, k in state.items() if name in keys}
+        with open(statefile + '.tmp', 'w') as f:
+            json.dump(state, f, indent=1, sort_keys=True)
+        os.replace(statefile + '.tmp', statefile)
+
+    with open(os.path.join(output, LEVELS), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['level', 'feature', 'value', 'unit'])
+        for level in range(1, numlevels + 1):
+            writer.writerow([level, feature, '%g' % values[level - 1], dsp.units[feature]])
+
+    return rendered, len(keys) - rendered
+
+
+def main(args=None):
+    parser = ConfigParser()
+    parser.read(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.ini'))
+
+    parser2 = argparse.ArgumentParser(prog='speechadjuster-render', description='render.py (part of SpeechAdjuster tool): renders the levels '
+                                      'of a target speech folder (prefix1..prefixN, e.g. stimuli/examples/tilt/adjustment/) from a folder of '
+                                      'unprocessed .wav files, with the gain, spectral tilt or pitch processing of levelmode = dsp. '
+                                      'Files whose source and level have not changed since the previous rendering are skipped.')
+    parser2.add_argument('source', type=str, help='Path to the folder of unprocessed .wav files. (type: string)')
+    parser2.add_argument('output', type=str, help='Path to the target speech folder to create or update. (type: string)')
+    parser2.add_argument('-f', '--feature', type=str, choices=dsp.features, default=parser.get('stimuli', 'dspfeature', fallback='gain'),
+                         help='gain (dB), tilt (dB/octave) or pitch (semitones). Default: dspfeature in config.ini. (type: string)')
+    parser2.add_argument('--min', type=float, default=parser.getfloat('stimuli', 'dspmin', fallback=-30),
+                         help='Value of the feature at level 1. Default: dspmin in config.ini. (type: float)')
+    parser2.add_argument('--max', type=float, default=parser.getfloat('stimuli', 'dspmax', fallback=0),
+                         help='Value of the feature at the highest level. Default: dspmax in config.ini. (type: float)')
+    parser2.add_argument('-n', '--levels', type=int, default=parser.getint('stimuli', 'dsplevels', fallback=25),
+                         help='Number of levels. Default: dsplevels in config.ini. (type: integer)')
+    parser2.add_argument('-p', '--prefix', type=str, default=parser.get('stimuli', 'prefix', fallback='level_'),
+                         help='Prefix of the levels\' folders. Default: prefix in config.ini. (type: string)')
+    parser2.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                         help='Number of processes. Default: the number of CPUs. (type: integer)')
+    args = parser2.parse_args(args)
+
+    if args.levels < 2:
+        sys.exit('[ERROR] More than one level should be rendered.')
+    if args.jobs < 1:
+        sys.exit('[ERROR] The argument jobs should be greater than zero.')
+    if os.path.abspath(args.source) == os.path.abspath(args.output):
+        sys.exit('[ERROR] The output directory should differ from the source directory.')
+    try:
+        rendered, unchanged = render(args.source, args.output, args.prefix, args.feature, args.min, args.max, args.levels, args.jobs)
+    except (OSError, ValueError) as error:
+        sys.exit('[ERROR] ' + str(error))
+
+    print(args.output + ': ' + str(args.levels) + ' levels of ' + args.feature + ', ' + str(rendered) + ' files rendered, '
+          + str(unchanged) + ' unchanged')
+
+if __name__ == "__main__":
+     sys.exit(main())
@@ -0,0 +1,111 @@
+#######################################################
+## Conversion of the stimuli and of the masker to the
+## format of the output stream: sample rate (polyphase
+## resampling) and number of channels.
+#######################################################
+#######################################################
+## Author: Olympia Simantiraki
+## License: GNU GPL v3
+## Version: v1.0.0
+## Email: olina.simantiraki@gmail.com
+#######################################################
+
+## A rate change by up/down (the ratio of the two rates reduced by their gcd) is the upsampling by up, the low-pass
+## filtering at the lower of the two Nyquist frequencies and the downsampling by down, computed without the zeros of the
+## upsampling: an output frame is the sum of K input frames weighted by one of the up phases of the filter. The filter
+## is a windowed sinc (Kaiser window) of HALF zero crossings on each side, designed once per (up, down). The output
+## frames r, r + up, r + 2 up, ... all use the same phase and their newest input frames are down frames apart, so each
+## of these series is one product of a strided view of the input (K frames per output frame) with the phase, computed
+## BLOCK output frames at a time. There is no loop over the frames, only over the up phases.
+
+from math import gcd
+import numpy as np
+
+HALF = 10      # zero crossings of the sinc on each side of its centre
+BETA = 5.      # beta of the Kaiser window
+BLOCK = 65536  # output frames of a series computed together
+
+# polyphase filters already designed, keyed by (up, down)
+_filters = {}
+
+
+def ratio(rate, outrate):
+    """up and down factors (reduced) of the conversion from rate to outrate.
+    """
+    g = gcd(int(rate), int(outrate))
+    return int(outrate) // g, int(rate) // g
+
+
+def polyphase(up, down):
+    """Returns the filter of the conversion by up/down as an up x K matrix (row p is the phase p) and its delay.
+    """
+    if (up, down) not in _filters:
+        factor = max(up, down)
+        half = HALF * factor
+        n = np.arange(-half, half + 1, dtype=np.float64)
+        h = np.sinc(n / factor) * np.kaiser(2 * half + 1, BETA) * (up / factor)
+        taps = -(-len(h) // up)
+        h = np.concatenate((h, np.zeros(taps * up - len(h))))
+        _filters[(up, down)] = (h.reshape(taps, up).T.astype(np.float32), half)
+    return _filters[(up, down)]
+
+
+def resample(samples, rate, outrate):
+    """Returns the float samples (frames x channels) converted from rate to outrate. The output has
+    ceil(frames * outrate / rate) frames and is aligned with the input (the delay of the filter is compensated).
+    """
+    up, down = ratio(rate, outrate)
+    if up == down:
+        return np.asarray(samples, dtype=np.float32)
+
+    phases, delay = polyphase(up, down)
+    taps = phases.shape[1]
+    frames = len(samples)
+    outframes = -(-frames * up // down)
+    out = np.zeros((outframes, samples.shape[1]), dtype=np.float32)
+    if frames == 0:
+        return out
+
+    # input frames taps - 1 before the first one and after the last one are zeros
+    last = ((outframes - 1) * down + delay) // up
+    x = np.zeros((taps - 1 + max(last + 1, frames), samples.shape[1]), dtype=np.float32)
+    x[taps - 1:taps - 1 + frames] = samples
+    # windows[i] holds the input frames i - taps + 1 .. i (frames x channels x taps), a view of x
+    windows = np.lib.stride_tricks.as_strided(x, shape=(len(x) - taps + 1, x.shape[1], taps),
+                                              strides=(x.strides[0], x.strides[1], x.strides[0]), writeable=False)
+    for r in range(min(up, outframes)):
+        t = r * down + delay
+        newest, phase = t // up, phases[t % up][::-1]
+        series = out[r::up]
+        for start in range(0, len(series), BLOCK):
+            n = min(BLOCK, len(series) - start)
+            first = newest + start * down
+            np.matmul(windows[first:first + (n - 1) * down + 1:down], phase, out=series[start:start + n])
+    return out
+
+
+def remix(samples, nchannels):
+    """Returns the float samples with nchannels channels: a mono signal is copied to every channel and a
+    multichannel one is averaged to mono. Other changes of the number of channels are not supported.
+    """
+    channels = samples.shape[1]
+    if channels == nchannels:
+        return samples
+    if channels == 1:
+        return np.repeat(samples, nchannels, axis=1)
+    if nchannels == 1:
+        return samples.mean(axis=1, keepdims=True, dtype=np.float32)
+    raise ValueError('Samples with ' + str(channels) + ' channels cannot be played on ' + str(nchannels) + ' channels.')
+
+
+def convert(samples, rate, outrate, nchannels):
+    """Returns the float samples converted to outrate and nchannels (see resample and remix).
+    """
+    return resample(remix(samples, nchannels), rate, outrate)
+
+
+def length(frames, rate, outrate):
+    """Number of frames of a signal of the given frames once converted from rate to outrate.
+    """
+    up, down = ratio(rate, outrate)
+    return -(-frames * up // down)
@@ -0,0 +1,158 @@
+#######################################################
+## Parsing of the pID_results.txt file of a session
+## (written by eventlog.py) and generation of the pID.csv
+## file (see results.py). Importing it has no side effects:
+## the worker processes of results.py --all import it.
+#######################################################
+#######################################################
+## Author: Olympia Simantiraki
+## License: GNU GPL v3
+## Version: v1.0.0
+## Email: olina.simantiraki@gmail.com
+#######################################################
+
+import re
+import logging
+import numpy as np
+import pandas as pd
+from resultstore import ResultStore
+
+logger = logging.getLogger(__name__)
+
+# one line of pID_results.txt: UTC time, three spaces and the event (other lines, e.g. the target audio IDs, are ignored)
+LINE = re.compile(r'^(?P<time>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d\.\d+)   '
+                  r'(?:Trial no: (?P<trial>\d+) Starting level: (?P<start>\d+)'
+                  r'|level = (?P<level>\d+)'
+                  r'|(?P<end>end of adjusting)'
+                  r'|Audio: (?P<audio>.*)'
+                  r'|Response: (?P<response>.*)'
+                  r'|Block : (?P<block>\d+)'
+                  r'|Target audio path : (?P<tpath>.*)'
+                  r'|SNR: (?P<snr>\S+))$')
+
+
+def parse_log(filename):
+    """parse_log function reads a pID_results.txt file. All the lines are classified and tokenized with one regular expression
+        and their timestamps (date included, so that sessions across midnight are handled) are converted at once.
+        Returns three DataFrames:
+          trials: one row per completed trial (index: trial number in the session) with the columns block, trial_no,
+                  starting_level, start, end, stabilization_time (sec), pref_level, tpath (target audio path of the block) and
+                  snr (dB, NaN if the target speech and the masker were not mixed at an SNR)
+          changes: one row per level change in the adjustment phase with the columns trial, block, trial_no, time (sec since
+                   the onset of the trial) and level
+          tests: one row per stimulus of the test phase with the columns trial, audio (path of the stimulus) and response
+    """
+    with open(filename) as f:
+        lines = pd.Series(f.read().splitlines(), dtype=object)
+    fields = lines.str.extract(LINE).dropna(subset=['time'])
+
+    time = pd.to_datetime(fields['time'], format='%Y-%m-%d %H:%M:%S.%f')
+    block = pd.to_numeric(fields['block']).ffill()
+    tpath = fields['tpath'].ffill()
+    is_trial = fields['trial'].notna()
+    is_end = fields['end'].notna()
+    trial = is_trial.cumsum()
+    adjusting = is_end.groupby(trial).cumsum() == 0
+
+    trials = pd.DataFrame({'block': block[is_trial], 'trial_no': fields['trial'][is_trial].astype(int),
+                           'starting_level': fields['start'][is_trial].astype(int), 'start': time[is_trial],
+                           'tpath': tpath[is_trial]})
+    trials.index = trial[is_trial]
+    trials['end'] = time[is_end].groupby(trial[is_end]).first()
+    trials = trials[trials['end'].notna() & (trials.index > 0)]
+    trials['block'] = trials['block'].fillna(1).astype(int)
+    trials['stabilization_time'] = (trials['end'] - trials['start']).dt.total_seconds()
+    is_snr = fields['snr'].notna()
+    trials['snr'] = pd.to_numeric(fields['snr'][is_snr]).groupby(trial[is_snr]).first().reindex(trials.index)
+
+    level = fields['level'].notna() & adjusting & trial.isin(trials.index)
+    changes = pd.DataFrame({'trial': trial[level], 'level': fields['level'][level].astype(int)})
+    changes['block'] = changes['trial'].map(trials['block'])
+    changes['trial_no'] = changes['trial'].map(trials['trial_no'])
+    changes['time'] = (time[level] - changes['trial'].map(trials['start'])).dt.total_seconds()
+    changes = changes[['trial', 'block', 'trial_no', 'time', 'level']].reset_index(drop=True)
+
+    # the preferred level is the last one of the adjustment phase
+    trials['pref_level'] = changes.groupby('trial')['level'].last().reindex(trials.index).fillna(
+        trials['starting_level']).astype(int)
+
+    # the stimuli and the responses of the test phase are paired by their order in the trial
+    audio = fields['audio'].notna() & trial.isin(trials.index)
+    response = fields['response'].notna() & trial.isin(trials.index)
+    audios = pd.DataFrame({'trial': trial[audio], 'audio': fields['audio'][audio]})
+    audios['n'] = audios.groupby('trial').cumcount()
+    responses = pd.DataFrame({'trial': trial[response], 'response': fields['response'][response]})
+    responses['n'] = responses.groupby('trial').cumcount()
+    tests = audios.merge(responses, on=['trial', 'n'], how='outer').sort_values(['trial', 'n'])
+    tests = tests[['trial', 'audio', 'response']].reset_index(drop=True)
+
+    return trials, changes, tests
+
+
+def adjustment_plots(trials, changes, pid, options):
+    """adjustment_plots function returns the plots (see plots.py) of the target speech level adjustments that the listener has
+        performed during each trial, one plot per block saved under the folder called plots (options: see datatocsv).
+    """
+    directory = options['directory']
+    jobs = []
+    for block, btrials in trials.groupby('block'):
+        bchanges = changes.loc[changes['block'] == block, ['trial', 'time', 'level']].reset_index(drop=True)
+        jobs.append(('adjustments', directory + 'plots/' + str(pid) + '_block' + str(block) + 'adjustments.pdf', bchanges,
+                     {'block': int(block), 'trials': [int(t) for t in btrials.index],
+                      'labels': btrials['trial_no'].astype(str).tolist(),
+                      'higherlevel': options['numlevels'][block-1], 'lowerlevel': options['lowerlevel'],
+                      'button_on': options['button_on']}))
+    return jobs
+
+
+def datatocsv(pid, options, logger=logger):
+    """datatocsv function reads the pID_results.txt of participant pid and generates the pID.csv. The file is stored under the folder called results.
+        It returns the plots of the target speech level adjustments that the listener has performed during each trial (see adjustment_plots).
+        options holds the settings of results.py: directory, knob, testphase, masker (the masker file or None), numlevels (the
+        number of levels of each block), lowerlevel and button_on.
+    """
+    logger.info("function datatocsv")
+    directory, testphase = options['directory'], options['testphase']
+
+    trials, changes, tests = parse_log(directory + 'results/' + pid + '_results.txt')
+
+    if testphase:
+        rows = tests.join(trials, on='trial')
+        target_audio = rows['audio'].str.split('/').str[-1].to_numpy()
+        response = rows['response'].str.split(' ').to_numpy()
+        fullpath = rows['audio'].str.split(' ').to_numpy()
+    else:
+        rows = trials
+        target_audio = response = float('nan')
+        fullpath = rows['tpath'].to_numpy()
+
+    df = pd.DataFrame()
+    df['pID'] = np.repeat(str(pid), repeats=len(rows), axis=0)
+    df['knob'] = options['knob']
+    df['block'] = rows['block'].to_numpy()
+    df['teston'] = testphase
+    df['trial_no'] = rows['trial_no'].to_numpy()
+    df['starting_level'] = rows['starting_level'].to_numpy()
+    df['stabilization_time'] = rows['stabilization_time'].to_numpy()
+    df['pref_level'] = rows['pref_level'].to_numpy()
+    df['target_audio'] = target_audio
+    df['response'] = response
+    df['fullpath'] = fullpath
+    df['masker'] = options['masker'] if options['masker'] else float('nan')
+    df['snr'] = rows['snr'].to_numpy()
+
+    df.to_csv(directory + 'results/' + pid + '.csv', index=False,
+                  header=['pID','knob','block','teston','trial_no', 'starting_level', 'stabilization_time', 'pref_level','target_audio', 'response', 'fullpath', 'masker', 'snr'])
+
+    return adjustment_plots(trials, changes, pid, options)
+
+
+def process(pid, options):
+    """process function generates the pID.csv of participant pid and stores the participant's data in the aggregate results.
+        It runs in the worker processes of the batch mode of results.py and returns the participant's plots, which are rendered
+        at the end.
+    """
+    jobs = datatocsv(pid, options)
+    ResultStore(options['directory'] + 'results/alldata/').append(
+        pd.read_csv(options['directory'] + 'results/' + pid + '.csv', delimiter=','))
+    return jobs
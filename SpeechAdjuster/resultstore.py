@@ -0,0 +1,223 @@
+#######################################################
+## Aggregate results of all participants: one shard
+## (.npz) per participant, an index and compaction.
+#######################################################
+#######################################################
+## Author: Olympia Simantiraki
+## License: GNU GPL v3
+## Version: v1.0.0
+## Email: olina.simantiraki@gmail.com
+#######################################################
+
+## Store layout (folder results/alldata/):
+##   <pID>.npz            one array per column with the rows of the participant, sorted by block
+##   _compacted-<ns>.npz  rows of several participants merged by compaction
+##   index.json           for every shard: size and mtime, participants, rows and row range of every block
+## A shard is written to a temporary file and renamed, so readers never see half a shard and sessions finishing at
+## the same time on different machines do not overwrite each other's rows. The index is only a cache of the shards'
+## metadata: shards missing from it (or changed since) are read again, so a lost index update is harmless.
+## If a participant is in several shards, the rows of the most recently written shard are used (for a compacted shard,
+## the time the compaction started reading).
+
+import sys
+import os
+import json
+import time
+import argparse
+from configparser import ConfigParser
+from urllib.parse import quote
+import numpy as np
+import pandas as pd
+
+COLUMNS = ['pID', 'knob', 'block', 'teston', 'trial_no', 'starting_level', 'stabilization_time', 'pref_level',
+           'target_audio', 'response', 'fullpath', 'masker', 'snr']
+EXTENSION = '.npz'
+INDEX = 'index.json'
+COMPACTED = '_compacted-'
+
+
+def _toarrays(df):
+    """Typed arrays of the columns of df, rows sorted by block. Text columns (and pID) are stored as unicode arrays
+    with '' for the missing values.
+    """
+    df = df.sort_values('block', kind='stable')
+    arrays = {}
+    for column in df.columns:
+        values = df[column]
+        if pd.api.types.is_numeric_dtype(values) and column != 'pID':
+            arrays[column] = values.to_numpy()
+        else:
+            arrays[column] = values.fillna('').astype(str).to_numpy(dtype=str)
+    return arrays
+
+
+def _written(item):
+    name, entry = item
+    if name.startswith(COMPACTED):
+        return int(name[len(COMPACTED):-len(EXTENSION)])
+    return entry['mtime_ns']
+
+
+class ResultStore:
+    """Append-only store of the aggregate results (see the layout above).
+       path: Path to the folder of the store
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _write(self, name, df):
+        arrays = _toarrays(df)
+        filename = os.path.join(self.path, name + EXTENSION)
+        tmp = filename + '.' + str(os.getpid()) + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, filename)
+        self.index(update=[name + EXTENSION])
+        return filename
+
+    def append(self, df):
+        """Stores the rows of one participant (df with the columns COLUMNS), replacing the ones stored before.
+        """
+        pids = df['pID'].astype(str).unique()
+        if len(pids) != 1:
+            raise ValueError('A shard holds the rows of one participant (found ' + str(list(pids)) + ').')
+        return self._write(quote(pids[0], safe=''), df)
+
+    def _entry(self, filename, stat):
+        with np.load(os.path.join(self.path, filename)) as z:
+            blocks = z['block']
+            pids = z['pID']
+        entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'rows': len(blocks),
+                 'pids': sorted(set(pids.tolist())), 'blocks': {}}
+        for block in np.unique(blocks).tolist():
+            rows = np.flatnonzero(blocks == block)
+            entry['blocks'][str(block)] = [int(rows[0]), int(rows[-1]) + 1]
+        return entry
+
+    def index(self, update=()):
+        """Returns the index (shard filename -> entry), after reading the metadata of the shards that are not in it,
+        have changed since or are in update.
+        """
+        filename = os.path.join(self.path, INDEX)
+        try:
+            with open(filename) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+
+        changed = False
+        shards = {}
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                if entry.name.endswith(EXTENSION) and entry.is_file():
+                    shards[entry.name] = entry.stat()
+        for name in list(index):
+            if name not in shards:
+                del index[name]
+                changed = True
+        for name, stat in shards.items():
+            old = index.get(name)
+            if name in update or old is None or old['size'] != stat.st_size or old['mtime_ns'] != stat.st_mtime_ns:
+                try:
+                    index[name] = self._entry(name, stat)
+                except (OSError, ValueError, KeyError):
+                    continue  # removed by a compaction meanwhile
+                changed = True
+
+        if changed:
+            try:
+                with open(filename + '.' + str(os.getpid()) + '.tmp', 'w') as f:
+                    json.dump(index, f, indent=1)
+                os.replace(filename + '.' + str(os.getpid()) + '.tmp', filename)
+            except OSError:
+                pass
+        return index
+
+    def read(self, columns=None, blocks=None):
+        """Returns the rows of all participants as a DataFrame. Only the given columns (default: all) and the rows of
+        the given blocks (default: all) are read from the shards.
+        """
+        index = self.index()
+        # the most recently written shard of every participant
+        owner = {}
+        for name, entry in sorted(index.items(), key=_written):
+            for pid in entry['pids']:
+                owner[pid] = name
+
+        frames = []
+        for name, entry in sorted(index.items(), key=_written):
+            owned = [pid for pid in entry['pids'] if owner[pid] == name]
+            ranges = [r for b, r in entry['blocks'].items() if blocks is None or int(b) in blocks]
+            if not owned or not ranges:
+                continue
+            with np.load(os.path.join(self.path, name)) as z:
+                names = [c for c in (columns or z.files) if c in z.files]
+                if len(owned) < len(entry['pids']) and 'pID' not in names:
+                    names.append('pID')
+                arrays = {c: z[c] for c in names}
+            rows = np.concatenate([np.arange(start, stop) for start, stop in sorted(ranges)])
+            df = pd.DataFrame({c: a[rows] for c, a in arrays.items()})
+            if len(owned) < len(entry['pids']):
+                df = df[df['pID'].isin(owned)]
+                if columns is not None and 'pID' not in columns:
+                    df = df.drop(columns='pID')
+            frames.append(df)
+
+        if not frames:
+            return pd.DataFrame(columns=columns or COLUMNS)
+        data = pd.concat(frames, ignore_index=True)
+        for column in data.columns:
+            if not pd.api.types.is_numeric_dtype(data[column]):
+                data[column] = data[column].replace('', np.nan)
+        return data
+
+    def compact(self):
+        """Merges all the shards into one. Returns the number of shards merged.
+        """
+        index = self.index()
+        if len(index) <= 1:
+            return 0
+        started = time.time_ns()
+        data = self.read()
+        self._write(COMPACTED + str(started), data[[c for c in COLUMNS if c in data.columns]])
+
+        merged = 0
+        for name, entry in index.items():
+            filename = os.path.join(self.path, name)
+            try:
+                # a shard written again during the compaction is kept, its rows are newer
+                if os.stat(filename).st_mtime_ns == entry['mtime_ns']:
+                    os.remove(filename)
+                    merged += 1
+            except OSError:
+                pass
+        self.index()
+        return merged
+
+
+def main(args=None):
+    parser = ConfigParser()
+    parser.read(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.ini'))
+    directory = parser.get('instructions', 'directory', fallback='')
+
+    parser2 = argparse.ArgumentParser(prog='speechadjuster-compact', description='resultstore.py (part of SpeechAdjuster tool): merges '
+                                      'the shards of the aggregate results (one per participant) into one shard.')
+    parser2.add_argument('store', type=str, nargs='?', default=directory + 'results/alldata/',
+                         help='Path to the folder of the aggregate results. Default: results/alldata/ under the directory in config.ini. (type: string)')
+    parser2.add_argument('--csv', type=str, help='Also write all the rows to this .csv file (the format of the previous alldata.csv). (type: string)')
+    args = parser2.parse_args(args)
+
+    if not os.path.isdir(args.store):
+        sys.exit('[ERROR] The directory ' + args.store + ' does not exist.')
+    store = ResultStore(args.store)
+    merged = store.compact()
+    print(args.store + ': ' + str(merged) + ' shards merged')
+    if args.csv:
+        data = store.read()
+        data.to_csv(args.csv, index=False, columns=[c for c in COLUMNS if c in data.columns])
+        print(args.csv + ': ' + str(len(data)) + ' rows')
+
+if __name__ == "__main__":
+     sys.exit(main())
@@ -0,0 +1,110 @@
+#######################################################
+## Levels of the target speech stimuli and of the masker
+## for mixing them at a given SNR (parameter snr),
+## cached between launches.
+#######################################################
+#######################################################
+## Author: Olympia Simantiraki
+## License: GNU GPL v3
+## Version: v1.0.0
+## Email: olina.simantiraki@gmail.com
+#######################################################
+
+## The level of a target speech stimulus is its active speech level: the RMS (dB re full scale) of its FRAME long frames
+## that are at most RANGE dB below its loudest frame, so the pauses do not count. The level of the masker is its RMS.
+## The levels of the files of a folder are cached in one file (like the manifests, see manifest.py), keyed by the size
+## and mtime of every file, and only measured again when a file has changed.
+
+import os
+import json
+import hashlib
+import numpy as np
+
+from stimulusbank import to_float
+
+VERSION = 1
+FRAME = 0.02
+RANGE = 30.
+
+cachedir = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+                        'speechadjuster', 'levels')
+
+
+def rms_level(samples):
+    """RMS (dB re full scale) of the float samples, all the channels together.
+    """
+    power = np.mean(np.square(samples, dtype=np.float64)) if samples.size else 0.
+    return 10 * np.log10(max(power, 1e-20))
+
+
+def active_level(samples, rate):
+    """Active speech level (dB re full scale) of the float samples (see above).
+    """
+    n = max(int(FRAME * rate), 1)
+    frames = len(samples) // n
+    if frames == 0:
+        return rms_level(samples)
+    power = np.mean(np.square(samples[:frames * n], dtype=np.float64).reshape(frames, -1), axis=1)
+    active = power >= power.max() * 10 ** (-RANGE / 10)
+    return 10 * np.log10(max(power[active].mean(), 1e-20))
+
+
+def _cachefile(folder):
+    key = hashlib.sha1(os.path.abspath(folder).encode('utf-8')).hexdigest()
+    return os.path.join(cachedir, key + '.json')
+
+
+def levels(folder, items, measure):
+    """Returns the level of every item of folder: items maps a name to (path of the file holding it, function returning
+    its float samples) and measure(samples) gives the level. Cached levels are used if the file has the same size and mtime.
+    """
+    cachefile = _cachefile(folder)
+    try:
+        with open(cachefile) as f:
+            cached = json.load(f)
+        entries = cached['levels'] if cached.get('version') == VERSION else {}
+    except (OSError, ValueError, KeyError):
+        entries = {}
+
+    result = {}
+    changed = False
+    for name, (path, load) in items.items():
+        stat = os.stat(path)
+        entry = entries.get(name)
+        if entry is None or entry[:2] != [stat.st_size, stat.st_mtime_ns]:
+            entry = entries[name] = [stat.st_size, stat.st_mtime_ns, float(measure(load()))]
+            changed = True
+        result[name] = entry[2]
+
+    if changed:
+        try:
+            os.makedirs(cachedir, exist_ok=True)
+            with open(cachefile + '.tmp', 'w') as f:
+                json.dump({'version': VERSION, 'path': os.path.abspath(folder), 'levels': entries}, f)
+            os.replace(cachefile + '.tmp', cachefile)
+        except OSError:
+            pass  # measured again on the next launch
+    return result
+
+
+def _samples(frames):
+    samples = np.zeros(frames.shape, dtype=np.float32)
+    to_float(frames, samples)
+    return samples
+
+
+def stimulus_levels(bank, wavids):
+    """Active speech levels of the stimuli wavids of bank (a StimulusBank), measured at level 1 (for a DspBank, on the
+    unprocessed files).
+    """
+    # the stimuli of an archive are keyed by the archive's size and mtime
+    items = {wavid: (bank.folder if bank.archive else bank.path(1, wavid),
+                     lambda wavid=wavid: _samples(bank.stimulus(1, wavid))) for wavid in wavids}
+    return levels(bank.levelpath(1), items, lambda samples: active_level(samples, bank.framerate))
+
+
+def masker_level(masker, path):
+    """RMS level of the loop of masker (a masker.Masker), cached for the file path.
+    """
+    name = os.path.basename(path)
+    return levels(os.path.dirname(os.path.abspath(path)), {name: (path, lambda: masker.loop)}, rms_level)[name]
@@ -14,9 +14,11 @@ import argparse
 import logging
 import platform
 import os
-import filecmp
 import time
 
+# end of each startup phase (time.perf_counter()), reported with --startup-profile
+startup = [('start', time.perf_counter())]
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 # create a file handler
@@ -29,6 +31,27 @@ handler.setFormatter(formatter)
 # add the file handler to the logger
 logger.addHandler(handler)
 
+
+def startup_phase(name):
+    """Marks the end of the startup phase name.
+    """
+    startup.append((name, time.perf_counter()))
+
+
+def startup_report():
+    """Logs the duration of each startup phase and prints it if --startup-profile is given.
+    """
+    lines = ['%-12s %8.1f ms' % (name, (t - startup[i][1]) * 1000) for i, (name, t) in enumerate(startup[1:])]
+    lines.append('%-12s %8.1f ms' % ('total', (startup[-1][1] - startup[0][1]) * 1000))
+    logger.info("Startup time: " + ', '.join(' '.join(line.split()) for line in lines))
+    if args.startup_profile:
+        print('Startup profile:\n  ' + '\n  '.join(lines))
+
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from pack import is_archive
+from manifest import load_stimuli
+
 parser = ConfigParser()
 # get the path to config.ini
 config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.ini')
@@ -41,6 +64,7 @@ parser2.add_argument('-t','--testfolder', type=str, help='Path(s) to target spee
                                                          'phase should be equal to those provided for the adjustment phase. If paramenter is empty, trials do not consist of a test phase.'
                                                          '(type: strings with comma delimiter)')
 parser2.add_argument('-m', '--masker', type=str, help='Path with masker filename (e.g. stimuli/maskers/SSN.wav). If paramenter is empty, target speech is presented in quiet. (type: string)')
+parser2.add_argument('--startup-profile', action='store_true', help='Print the time spent in each startup phase (config, validation, kivy import, first frame, audio init).')
 args = parser2.parse_args()
 
 if all(v is None for v in [args.adjustmentfolder,args.masker,args.testfolder,args.username]):
@@ -72,11 +96,29 @@ try:
     speech_on = parser.getfloat('setup_test', 'speech_on')
     knob = parser.getboolean('setup_adj', 'knob')
     saveaudio = parser.getboolean('setup_adj', 'saveaudio')
+    telemetry = parser.getboolean('stimuli', 'telemetry')
     directory = parser.get('instructions', 'directory')
     blktxt=parser.get('instructions', 'blktxt')
     exittime = parser.getfloat('instructions', 'exittime')
     audiochunk = parser.getfloat('stimuli', 'audiochunk')
     maskerchunk = parser.getfloat('stimuli', 'maskerchunk')
+    maskerfade = parser.getfloat('stimuli', 'maskerfade')
+    snrs = [float(v) for v in parser.get('stimuli', 'snr').split(',')] if parser.get('stimuli', 'snr').strip() else []
+    maskeroffset = parser.getboolean('stimuli', 'maskeroffset')
+    maskerseed = parser.getint('stimuli', 'maskerseed')
+    bankbudget = parser.getfloat('stimuli', 'bankbudget')
+    bankmode = parser.get('stimuli', 'bankmode')
+    levelmode = parser.get('stimuli', 'levelmode')
+    dspfeature = parser.get('stimuli', 'dspfeature')
+    dspmin = parser.getfloat('stimuli', 'dspmin')
+    dspmax = parser.getfloat('stimuli', 'dspmax')
+    dsplevels = parser.getint('stimuli', 'dsplevels')
+    fadelength = parser.getfloat('stimuli', 'fadelength')
+    fadecurve = parser.get('stimuli', 'fadecurve')
+    outputrate = parser.getint('stimuli', 'outputrate')
+    outputchannels = parser.getint('stimuli', 'outputchannels')
+    audiobackend = parser.get('stimuli', 'audiobackend')
+    audiospeed = parser.getfloat('stimuli', 'audiospeed')
     uplimtxt = parser.get('instructions','uplimtxt')
     lowlimtxt = parser.get('instructions','lowlimtxt')
     testparttxt = parser.get('instructions', 'testparttxt')
@@ -100,6 +142,19 @@ try:
     assert username, sys.exit('The argument --username should not be empty.')
     assert audiochunk > 0, sys.exit('The parameter audiochunk should be greater than zero.')
     assert maskerchunk > 0, sys.exit('The parameter maskerchunk should be greater than zero.')
+    assert maskerfade > 0, sys.exit('The parameter maskerfade should be greater than zero.')
+    assert maskerseed >= 0, sys.exit('The parameter maskerseed should be greater than or equal to zero.')
+    assert bankbudget > 0, sys.exit('The parameter bankbudget should be greater than zero.')
+    assert bankmode in ('memory', 'mmap', 'auto'), sys.exit('The parameter bankmode should be memory, mmap or auto.')
+    assert levelmode in ('folders', 'dsp'), sys.exit('The parameter levelmode should be folders or dsp.')
+    assert dspfeature in ('gain', 'tilt', 'pitch'), sys.exit('The parameter dspfeature should be gain, tilt or pitch.')
+    assert dsplevels > 1, sys.exit('The parameter dsplevels should be greater than one.')
+    assert fadelength > 0, sys.exit('The parameter fadelength should be greater than zero.')
+    assert fadecurve in ('linear', 'equalpower'), sys.exit('The parameter fadecurve should be linear or equalpower.')
+    assert outputrate >= 0, sys.exit('The parameter outputrate should be greater than or equal to zero.')
+    assert outputchannels >= 0, sys.exit('The parameter outputchannels should be greater than or equal to zero.')
+    assert audiobackend in ('pyaudio', 'null', 'file'), sys.exit('The parameter audiobackend should be pyaudio, null or file.')
+    assert audiospeed >= 0, sys.exit('The parameter audiospeed should be greater than or equal to zero.')
 
 except AssertionError as error:
     sys.exit("[ERROR] in configuration file (config.ini) or in command line arguments.")
@@ -130,47 +185,27 @@ if os.path.exists(directory + 'results/' + str(username) + "_results.txt") :
 if not args.masker:
     quiet = True
 
+startup_phase('config')
+
 args.adjustmentfolder = args.adjustmentfolder.split(',')
 len_adjustmentfolder = len(args.adjustmentfolder)
 lowerlevel = 1
+# with levelmode = dsp the folders hold the unprocessed stimuli, rendered at dsplevels levels (see dsp.py)
+levels = dsplevels if levelmode == 'dsp' else None
 
-for ch in range(0,len_adjustmentfolder):
-    if not os.path.exists(args.adjustmentfolder[ch]):
-        logger.error('The directory ' + args.adjustmentfolder[ch] +' does not exist.')
-        sys.exit('[ERROR] The directory ' + str(args.adjustmentfolder[ch]) +' does not exist.')
-
-for k in range(0, len_adjustmentfolder):
-    if len(next(os.walk(args.adjustmentfolder[k]))[1]) == 1:
-        logger.error(
-            'More than one levels/folders should exist.')
-        sys.exit("[ERROR] More than one levels/folders should exist.")
-
+# levels, filenames and .wav headers of each folder (or archive), scanned once or loaded from the manifest cache
+adjstimuli = []
 for j in range(0, len_adjustmentfolder):
-    args.adjustmentfolder[j] = args.adjustmentfolder[j] + '/'
-    for i in range(lowerlevel, len(next(os.walk(args.adjustmentfolder[j]))[1]) + 1):
-        if not os.path.exists(args.adjustmentfolder[j] +prefix+ str(i)):
-            logger.error('Adjustment phase: folder ' + args.adjustmentfolder[j] + prefix + str(i) + " does not exist. In the directory  " + args.adjustmentfolder[j] + " only the folders with the target speech stimuli should exist starting with the prefix " +prefix+
-                         '.\nAll the folders with integer IDs from 1 to the maximum number of levels with step 1 should exist.')
-            sys.exit("[ERROR] Adjustment phase: folder does not exist.\n"+ 'Adjustment phase: folder ' + args.adjustmentfolder[j] + prefix + str(i) + " does not exist. In the directory  " + args.adjustmentfolder[j] + " only the folders with the target speech stimuli should exist starting with the prefix " +prefix+
-                         '.\nAll the folders with integer IDs from 1 to the maximum number of levels with step 1 should exist.')
-
-        dcmp = filecmp.dircmp( args.adjustmentfolder[j] + prefix + str(lowerlevel) + '/', args.adjustmentfolder[j]+ prefix + str(i) + '/')
-        if '.DS_Store' in dcmp.left_only: dcmp.left_only.remove('.DS_Store')
-        if '.DS_Store' in dcmp.right_only: dcmp.right_only.remove('.DS_Store')
-        res_left = [x for x in dcmp.left_only if re.search('.wav', x)]
-        res_right = [x for x in dcmp.right_only if re.search('.wav', x)]
-
-        if len([name for name in os.listdir(args.adjustmentfolder[j] +'/'+ prefix + str(i)) if name.endswith(".wav")]) == 0:
-            sys.exit('[ERROR] The directory '+ args.adjustmentfolder[j] +  prefix + str(i) + '  does not contain .wav files.' )
-            logger.error('[ERROR] The directory '+ args.adjustmentfolder[j] + prefix + str(i) + '  does not contain .wav files.' )
-
-        if (len(dcmp.left_only) > 0 and len(res_left) > 0) or (len(dcmp.right_only) > 0  and len(res_right) > 0):
-            logger.error(
-                'All the levels/folders in the same directory should contain .wav files with the same filenames.')
-            logger.error('Files only in directory '+ args.adjustmentfolder[j] + prefix + str(lowerlevel) +'/' +'  : '+ str(dcmp.left_only))
-            logger.error('Files only in directory ' + args.adjustmentfolder[j] + prefix + str(i)  + '/' + '  : ' + str(dcmp.right_only))
-            sys.exit("[ERROR] Adjustment phase: file does not exist. \nAll the levels/folders in the same directory should contain .wav files with the same filenames.\n\n"+
-                     'Different files in directory '+ args.adjustmentfolder[j] + prefix + str(lowerlevel) +'/' +'  : '+ str(dcmp.left_only)+'\nDifferent files in directory ' + adjustmentfolder[j] + prefix + str(i)  + '/' + '  : ' + str(dcmp.right_only))
+    if not os.path.exists(args.adjustmentfolder[j]):
+        logger.error('The directory ' + args.adjustmentfolder[j] +' does not exist.')
+        sys.exit('[ERROR] The directory ' + str(args.adjustmentfolder[j]) +' does not exist.')
+    try:
+        adjstimuli.append(load_stimuli(args.adjustmentfolder[j], prefix, levels))
+    except ValueError as error:
+        logger.error('Adjustment phase: ' + str(error))
+        sys.exit('[ERROR] Adjustment phase: ' + str(error))
+    if not is_archive(args.adjustmentfolder[j]):
+        args.adjustmentfolder[j] = args.adjustmentfolder[j] + '/'
 
 if not args.testfolder:
     testphase = False
@@ -183,58 +218,39 @@ else:
     if len_testfolder != len_adjustmentfolder:
         logger.error('The total number of paths provided in the command line for the test phase should be equal to that provided for the adjustment phase.')
         sys.exit("[ERROR] The total number of paths provided in the command line for the test phase should be equal to that provided for the adjustment phase.")
+
+    teststimuli = []
     for j in range(0, len(args.testfolder)):
-        args.testfolder[j] = args.testfolder[j] + '/'
-        for i in range(lowerlevel, len(next(os.walk(args.adjustmentfolder[j]))[1]) + 1):
-            if not os.path.exists(args.testfolder[j] +prefix+ str(i)):
-                logger.error('Test phase: folder ' + args.testfolder[j] +prefix+ str(i) + " does not exist. In the directory  " +args.testfolder[j]+ " only the folders with the target speech stimuli should exist starting with the prefix " +prefix+
-                             '.\n All the folders with integer IDs from 1 to the maximum number of levels with step 1 should exist.\n The total number of levels/folders provided in the directory for the test phase should be equal to that provided for the adjustment phase.')
-                sys.exit('[ERROR] Test phase: folder ' + args.testfolder[j] +prefix+ str(i) + " does not exist. In the directory  " +args.testfolder[j]+ " only the folders with the target speech stimuli should exist starting with the prefix " +prefix+
-                             '.\n All the folders with integer IDs from 1 to the maximum number of levels with step 1 should exist.\n The total number of levels/folders provided in the directory for the test phase should be equal to that provided for the adjustment phase.')
-
-            dcmp = filecmp.dircmp(args.testfolder[j] + prefix + str(lowerlevel) + '/',
-                                  args.testfolder[j] + prefix + str(i) + '/')
-            if '.DS_Store' in dcmp.left_only: dcmp.left_only.remove('.DS_Store')
-            if '.DS_Store' in dcmp.right_only: dcmp.right_only.remove('.DS_Store')
-            res_left = [x for x in dcmp.left_only if re.search('.wav', x)]
-            res_right = [x for x in dcmp.right_only if re.search('.wav', x)]
-
-            if len([name for name in os.listdir(args.testfolder[j] + '/' + prefix + str(i)) if
-                        name.endswith(".wav")]) == 0:
-                sys.exit('[ERROR] The directory ' + args.testfolder[j] + prefix + str(
-                    i) + '  does not contain .wav files.')
-                logger.error('[ERROR] The directory ' + args.testfolder[j] + prefix + str(
-                    i) + '  does not contain .wav files.')
-
-            if len(dcmp.left_only) > 0 or len(dcmp.right_only) > 0:
-                logger.error('All the levels/folders in the same directory should contain .wav files with the same filenames.')
-                logger.error(
-                    'Files only in directory ' + args.testfolder[j] + prefix + str(lowerlevel) + '/' + '  : ' + str(
-                        dcmp.left_only))
-                logger.error('Files only in directory ' + args.testfolder[j] + prefix + str(i) + '/' + '  : ' + str(
-                    dcmp.right_only))
-                sys.exit(
-                    "[ERROR] Test phase: file does not exist. \nAll the levels/folders in the same directory should contain .wav files with the same filenames.\n\n" +
-                    'Different files in directory ' + args.testfolder[j] + prefix + str(
-                        lowerlevel) + '/' + '  : ' + str(dcmp.left_only) + '\nDifferent files in directory ' +
-                    args.testfolder[j] + prefix + str(i) + '/' + '  : ' + str(dcmp.right_only))
-
-    # for mac works:
-    # wavs_test = glob.glob(testfolder[0] +'/'+  prefix +str(lowerlevel) + '/*.wav')
-    # wavs_test = [w.replace(testfolder[0] +'/'+ prefix + str(lowerlevel) + '/', '') for w in wavs_test]
+        if not os.path.exists(args.testfolder[j]):
+            logger.error('The directory ' + args.testfolder[j] +' does not exist.')
+            sys.exit('[ERROR] The directory ' + str(args.testfolder[j]) +' does not exist.')
+        try:
+            teststimuli.append(load_stimuli(args.testfolder[j], prefix, levels))
+        except ValueError as error:
+            logger.error('Test phase: ' + str(error))
+            sys.exit('[ERROR] Test phase: ' + str(error))
+        if teststimuli[j].numlevels < adjstimuli[j].numlevels:
+            logger.error('Test phase: ' + args.testfolder[j] + ' has ' + str(teststimuli[j].numlevels) + ' levels while '
+                         + args.adjustmentfolder[j] + ' has ' + str(adjstimuli[j].numlevels) + '.')
+            sys.exit('[ERROR] Test phase: The total number of levels/folders provided in the directory for the test phase should be equal to that provided for the adjustment phase.')
+        if not is_archive(args.testfolder[j]):
+            args.testfolder[j] = args.testfolder[j] + '/'
+
+if snrs and len(snrs) not in (1, len_adjustmentfolder):
+    logger.error('The parameter snr has ' + str(len(snrs)) + ' values for ' + str(len_adjustmentfolder) + ' blocks.')
+    sys.exit('[ERROR] The parameter snr should have one value or one value per block (target speech path given with -a).')
+if snrs and quiet:
+    logger.warning('The parameter snr is ignored, no masker is used.')
 
 logger.info("Parameters checking has ended successfully. ")
-
-is_mac = platform == 'Darwin'
+startup_phase('validation')
 
 os.environ['KIVY_NO_ARGS'] = 'T'
 
+# the audio modules (numpy, pyaudio) and the hyperknob are imported after the first frame (see init_audio and build_widgets)
 import kivy
 kivy.require('1.0.8')
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from hyperknob import HyperKnob
 from kivy.config import Config
-from datetime import datetime
 from kivy.app import App
 from kivy.uix.button import Button
 from kivy.uix.label import Label
@@ -242,12 +258,9 @@ from kivy.uix.textinput import TextInput
 from kivy.uix.relativelayout import RelativeLayout
 from kivy.clock import Clock
 from kivy.core.window import Window
-import pyaudio
 import wave
 import math
-import numpy as np
 import random
-import threading
 from kivy.properties import BooleanProperty, NumericProperty, ListProperty
 
 
@@ -255,57 +268,12 @@ Config.set('kivy', 'exit_on_escape', '1')
 Window.clearcolor = (.6, .6, .6, .2)
 Window.fullscreen = 'auto'
 _is_desktop = False
+startup_phase('kivy import')
 
 
 class SpeechAdjuster(RelativeLayout):
 
-    completion_button = Button(text=btntxt,
-                     pos_hint={'center_x': .5, 'center_y': .3}, size_hint=(.35, .08),
-                     font_size='45dp', background_color=[1, 1, 1, .1],
-                     color=[1, 1, 1, .1])
-
-    adj_label = Label(color=[.9, .9, .9, 1], font_size='50dp',
-                           pos_hint={'center_x': .5, 'center_y': .95})
-
-    higher_lim = Label(text='', pos_hint={'center_x': .5, 'center_y': .8},
-                           size_hint=(.28, .05), font_size='50dp', color=(1, 1, 1, .7))
-    lower_lim = Label(text='', pos_hint={'center_x': .5, 'center_y': .4},
-                           size_hint=(.28, .05),
-                           font_size='50dp', color=[1, 1, 1, .7])
-
-    button_up = Button(background_color=[1, 1, 1, .7], background_normal='graphics/up.png',
-                      background_down='graphics/up.png',
-                      border=(8, 8, 8, 8), color=[1, 1, 1, .5], size_hint=(.09, .09),
-                      pos_hint={'center_x': .5, 'center_y': .67})
-
-    button_down = Button(background_color=[1, 1, 1, .7], background_normal='graphics/down.png',
-                        background_down='graphics/down.png',
-                        border=(8, 8, 8, 8), color=[1, 1, 1, .5], size_hint=(.09, .09),
-                        pos_hint={'center_x': .5, 'center_y': .54})
-
-    test_label = Label(text=testparttxt, color=[1, 1, 1, .1], font_size='50dp',
-                        pos_hint={'center_x': .18, 'center_y': .18})
-
-    text_in = TextInput( is_focusable=True, focus=True, background_color=[1, 1, 1, .1],
-                           font_size='50dp', size_hint=(.98, .11), pos_hint={'center_x': .5, 'center_y': .08},
-                           multiline=False)
-
-    hyper_knob = HyperKnob(pos_hint={'center_x': .5, 'center_y': .55}, size=('500dp', '500dp'),
-                          minangle=-140, maxangle=140, line_start=.82, line_end=.95, knob_radius=.95,
-                          track_proportion=.8)
-
-    block_num_label = Label(text='', color=[.9, .9, .9, 1], font_size='37dp',
-                     pos_hint={'center_x': .5, 'center_y': .96})
-
-    instr_label = Label(text=instructions, color=[.9, .9, .9, 1], font_size='37dp',
-                   pos_hint={'center_x': .5, 'center_y': .8})
-
-    start_button = Button(text=btnstart, markup=True, pos_hint={'center_x': .5, 'center_y': .15},
-                    size_hint=(.15, .05), font_size='40dp', background_color=[.1, .1, .1, 1],
-                    color=[1, 1, 1, 1])
-
     on_adjustmentphase = BooleanProperty(True)
-    value_changed = BooleanProperty(False)
     button_pressed = BooleanProperty(False)
     key_pressed = BooleanProperty(False)
 
@@ -314,27 +282,112 @@ class SpeechAdjuster(RelativeLayout):
         self._keyboard = Window.request_keyboard(self._keyboard_closed, self)
         self._keyboard.bind(on_key_down=self._on_keyboard_down)
 
-        self.p = pyaudio.PyAudio()
-        self.p_noise = pyaudio.PyAudio()
+        self.engine = None
+        self.widgets = False
         self.current_pos = 0
         self.prev_wav_len = 1
         self.block_num = 1
         self.iteration = 1
         self.tmp_fid = 0
-        self.data_append = tuple()
+        self.recorder = None
+        self.audiofile = None    # file of the current trial's recording (parameter saveaudio)
+        self.events = None
+        self.input = (None, 0)   # level set by the last input event and its time.monotonic_ns()
+        self.changed = None      # level change waiting for the chunk that carries it (see latency.py)
+        self.snr = None          # SNR of the current block (parameter snr)
+        self.gains = {}          # gain of every target speech stimulus of the block in the adjustment phase
+        self.tgains = {}         # and in the test phase
 
         self.count_frames=0
-        self.data2=[]
+
+        # only the widgets of the first screen are created before the first frame
+        self.block_num_label = Label(text='', color=[.9, .9, .9, 1], font_size='37dp',
+                                     pos_hint={'center_x': .5, 'center_y': .96})
+
+        self.instr_label = Label(text=instructions, color=[.9, .9, .9, 1], font_size='37dp',
+                                 pos_hint={'center_x': .5, 'center_y': .8})
+
+        self.start_button = Button(text=btnstart, markup=True, pos_hint={'center_x': .5, 'center_y': .15},
+                                   size_hint=(.15, .05), font_size='40dp', background_color=[.1, .1, .1, 1],
+                                   color=[1, 1, 1, 1])
+
+        self.start_button.bind(on_release=self.start_controller)
+
+        Clock.schedule_once(self.starting_panel)
+        Window.bind(on_flip=self.first_frame)
+
+    def first_frame(self, *kwargs):
+        """Called once the first screen is drawn. The widgets of the trials and the output stream are created
+        in the next frames, while the instructions are read.
+        """
+        Window.unbind(on_flip=self.first_frame)
+        startup_phase('first frame')
+        Clock.schedule_once(self.build_widgets)
+        Clock.schedule_once(self.init_audio)
+
+    def build_widgets(self, *kwargs):
+        """Creates the widgets of the adjustment and test phases.
+        """
+        if self.widgets:
+            return
+        from hyperknob import HyperKnob
+
+        self.completion_button = Button(text=btntxt,
+                                        pos_hint={'center_x': .5, 'center_y': .3}, size_hint=(.35, .08),
+                                        font_size='45dp', background_color=[1, 1, 1, .1],
+                                        color=[1, 1, 1, .1])
+
+        self.adj_label = Label(color=[.9, .9, .9, 1], font_size='50dp',
+                               pos_hint={'center_x': .5, 'center_y': .95})
+
+        self.higher_lim = Label(text='', pos_hint={'center_x': .5, 'center_y': .8},
+                                size_hint=(.28, .05), font_size='50dp', color=(1, 1, 1, .7))
+        self.lower_lim = Label(text='', pos_hint={'center_x': .5, 'center_y': .4},
+                               size_hint=(.28, .05),
+                               font_size='50dp', color=[1, 1, 1, .7])
+
+        self.button_up = Button(background_color=[1, 1, 1, .7], background_normal='graphics/up.png',
+                                background_down='graphics/up.png',
+                                border=(8, 8, 8, 8), color=[1, 1, 1, .5], size_hint=(.09, .09),
+                                pos_hint={'center_x': .5, 'center_y': .67})
+
+        self.button_down = Button(background_color=[1, 1, 1, .7], background_normal='graphics/down.png',
+                                  background_down='graphics/down.png',
+                                  border=(8, 8, 8, 8), color=[1, 1, 1, .5], size_hint=(.09, .09),
+                                  pos_hint={'center_x': .5, 'center_y': .54})
+
+        self.test_label = Label(text=testparttxt, color=[1, 1, 1, .1], font_size='50dp',
+                                pos_hint={'center_x': .18, 'center_y': .18})
+
+        self.text_in = TextInput( is_focusable=True, focus=True, background_color=[1, 1, 1, .1],
+                                 font_size='50dp', size_hint=(.98, .11), pos_hint={'center_x': .5, 'center_y': .08},
+                                 multiline=False)
+
+        self.hyper_knob = HyperKnob(pos_hint={'center_x': .5, 'center_y': .55}, size=('500dp', '500dp'),
+                                    minangle=-140, maxangle=140, line_start=.82, line_end=.95, knob_radius=.95,
+                                    track_proportion=.8)
 
         self.button_up.bind(on_press=self.increment)
         self.button_down.bind(on_press=self.decrement)
         self.button_up.bind(on_release=self.button_release)
         self.button_down.bind(on_release=self.button_release)
         self.text_in.bind(on_text_validate=self.on_validate)
-        self.start_button.bind(on_release=self.start_controller)
+        self.hyper_knob.bind(value=self.knob_moved)
         self.completion_button.bind(on_release=self.completion_button_pressed)
+        self.widgets = True
 
-        Clock.schedule_once(self.starting_panel)
+    def tag_input(self, level=None):
+        """Records the time of the input event that set the level (the current one if None), for the latency measurement,
+        and logs the event in pID_events.csv. The callback applies at most one level per chunk, the last one asked for.
+        """
+        self.input = (self.value if level is None else level, time.monotonic_ns())
+        self.events.input(*self.input)
+
+    def knob_moved(self, knob, value):
+        if knob.touched:
+            level = int(math.floor(value))
+            if level != self.input[0]:
+                self.tag_input(level)
 
     def show_keyboard(self, event):
         self.text_in.focus = True
@@ -348,6 +401,7 @@ class SpeechAdjuster(RelativeLayout):
 
                 if self.value > lowerlevel:
                     self.value -= 1
+                    self.tag_input()
                     self.lower_lim.text = ''
                     self.higher_lim.text = ''
 
@@ -360,6 +414,7 @@ class SpeechAdjuster(RelativeLayout):
 
                 if self.value < self.higherlevel:
                     self.value += 1
+                    self.tag_input()
                     self.lower_lim.text = ''
                     self.higher_lim.text = ''
 
@@ -384,9 +439,7 @@ class SpeechAdjuster(RelativeLayout):
         logger.info("function start_controller")
 
         self.i = 1
-        self.threads = []
         self.next_wav = 0
-        self.value_changed = False
         self.button_pressed = False
         self.count_phrases = 1
         self.testwavIds_i = 0
@@ -396,16 +449,20 @@ class SpeechAdjuster(RelativeLayout):
         self.noise_off = True
         self.key_pressed = False
 
-        self.higherlevel = len(next(os.walk(args.adjustmentfolder[self.block_num-1]))[1])
+        self.build_widgets()
+        self.init_audio()
 
-        wavs_adj = [name for name in os.listdir(args.adjustmentfolder[self.block_num-1] + '/' + prefix + str(lowerlevel)) if
-                    name.endswith(".wav")]
+        self.higherlevel = adjstimuli[self.block_num-1].numlevels
+
+        wavs_adj = adjstimuli[self.block_num-1].wavids
 
         self.adjustwavIds = random.sample(wavs_adj, len(wavs_adj))  # random order of .wav files in adjustment phase
 
         self.write_txt("Adjustment phase target audio IDs : " + str(self.adjustwavIds))
         self.write_txt("Block : " + str(self.block_num))
         self.write_txt("Target audio path : " + str(args.adjustmentfolder[self.tmp_fid]))
+        if maskeroffset and not quiet and self.block_num == 1:
+            self.write_txt("Masker seed : " + str(self.seed))
 
         self.remove_widget(self.start_button)
         self.remove_widget(self.instr_label)
@@ -431,11 +488,12 @@ class SpeechAdjuster(RelativeLayout):
             self.add_widget(self.test_label)
             self.text_in.disabled = True
 
-            wavs_test = [name for name in os.listdir(args.testfolder[self.block_num-1] + '/' + prefix + str(lowerlevel)) if
-                         name.endswith(".wav")]
+            wavs_test = teststimuli[self.block_num-1].wavids
 
             self.testwavIds = random.sample(wavs_test, len(wavs_test))  # random order of .wav files in test phase
 
+        self.load_banks()
+
         self.completion_button.disabled = False
         self.add_widget(self.adj_label)
         self.add_widget(self.completion_button)
@@ -443,39 +501,225 @@ class SpeechAdjuster(RelativeLayout):
 
         self.update()
 
+    def load_banks(self):
+        """Decodes all the levels of the current block's target speech (adjustment and test phase) into memory,
+        or memory-maps them (parameter bankmode), so that no file is opened while audio is streaming. The banks are
+        normally loaded in the background while the block's instructions are shown (see prefetch_block).
+        """
+        logger.info("function load_banks")
+
+        self.bank = self.tbank = None  # release the previous block's stimuli before loading the new ones
+        try:
+            self.bank, self.tbank = self.prefetcher.result(('block', self.tmp_fid), self.open_banks, self.tmp_fid)
+            footprint = self.bank.nbytes
+            modes = self.bank.mode
+            if testphase:
+                footprint += self.tbank.nbytes
+                modes += '/' + self.tbank.mode
+            # the first sentence of the block is mapped now, the next ones are prefetched while the previous one plays
+            self.bank.prepare(self.adjustwavIds[self.next_wav % len(self.adjustwavIds)])
+        except ValueError as error:
+            logger.error(error)
+            sys.exit('[ERROR] ' + str(error))
+
+        logger.info("Stimulus bank of block " + str(self.block_num) + ": " + str(self.higherlevel) + " levels, "
+                    + str(len(self.adjustwavIds)) + " adjustment and " + str(len(self.testwavIds) if testphase else 0)
+                    + " test stimuli, mode " + modes + ", " + "%.1f" % (footprint / 2**20) + " MB in memory (budget "
+                    + str(bankbudget) + " MB)")
+        if levelmode == 'dsp':
+            logger.info("Levels rendered in real time: " + dspfeature + " from " + self.bank.levels.label(lowerlevel)
+                        + " to " + self.bank.levels.label(self.higherlevel))
+
+        if snrs and not quiet:
+            self.calibrate()
+
+    def calibrate(self):
+        """Sets the gains of the current block's target speech stimuli and of the masker for the block's SNR (parameter
+        snr): the stimuli are brought to their average active speech level and the masker to that level minus the SNR.
+        """
+        levels = stimulus_levels(self.bank, self.adjustwavIds)
+        tlevels = stimulus_levels(self.tbank, self.testwavIds) if testphase else {}
+        values = list(levels.values()) + list(tlevels.values())
+        reference = sum(values) / len(values)
+        self.snr = snrs[self.block_num - 1] if len(snrs) > 1 else snrs[0]
+        self.gains = {wavid: 10 ** ((reference - level) / 20) for wavid, level in levels.items()}
+        self.tgains = {wavid: 10 ** ((reference - level) / 20) for wavid, level in tlevels.items()}
+        self.engine.masker_gain = 10 ** ((reference - self.snr - self.noise_level) / 20)
+        logger.info("SNR of block " + str(self.block_num) + ": " + str(self.snr) + " dB, target speech at "
+                    + "%.1f" % reference + " dBFS (active speech level, stimuli from " + "%.1f" % min(values) + " to "
+                    + "%.1f" % max(values) + " dBFS), masker gain " + "%.1f" % (reference - self.snr - self.noise_level) + " dB")
+
+    def open_banks(self, fid):
+        """Returns the banks of the adjustment and test phase (None without a test phase) of the target speech folder
+        fid. It runs in the prefetcher's thread; the levels of the stimuli are measured there too if they are needed
+        (parameter snr), so that calibrate() finds them in the cache.
+        """
+        numlevels = adjstimuli[fid].numlevels
+        bank = self.open_bank(adjstimuli[fid], numlevels, adjstimuli[fid].wavids, bankbudget * 2**20)
+        tbank = None
+        if testphase:
+            tbank = self.open_bank(teststimuli[fid], numlevels, teststimuli[fid].wavids, bankbudget * 2**20 - bank.nbytes)
+        if snrs and not quiet:
+            stimulus_levels(bank, bank.wavids)
+            if tbank is not None:
+                stimulus_levels(tbank, tbank.wavids)
+        return bank, tbank
+
+    def open_bank(self, stimuli, numlevels, wavids, budget):
+        """Returns the bank of the stimuli wavids with numlevels levels: pre-rendered (StimulusBank) or rendered while
+        they are played (DspBank, parameter levelmode), converted to the format of the output stream.
+        """
+        rate, nchannels = self.engine.rate, self.engine.nchannels
+        if levelmode == 'dsp':
+            return DspBank(stimuli, numlevels, wavids, budget, bankmode, dspfeature, dspmin, dspmax, rate, nchannels)
+        return StimulusBank(stimuli, numlevels, wavids, budget, bankmode, rate, nchannels)
+
+    def prefetch_block(self):
+        """Starts loading the banks of the current block in the background, while its instructions are shown.
+        The previous block's banks are released first.
+        """
+        self.bank = self.tbank = None
+        self.prefetcher.submit(('block', self.tmp_fid), self.open_banks, self.tmp_fid)
+
+    def prefetch_speech(self):
+        """Starts reading the sentence after the current one of the adjustment phase in the background, at the current
+        level, so that it is in memory when it follows the gap (parameter bankmode = mmap; the other banks are in memory).
+        """
+        wavid = self.adjustwavIds[(self.next_wav + 1) % len(self.adjustwavIds)]
+        self.prefetcher.submit(None, self.bank.prefetch, self.value, wavid)
+
+    def prefetch_tests(self):
+        """Starts reading the sentences of the test phase of the trial in the background, at the level chosen in the
+        adjustment phase, while the delays test1audio and testaudio pass.
+        """
+        for i in range(numOftesting):
+            wavid = self.testwavIds[(self.testwavIds_i + i) % len(self.testwavIds)]
+            self.prefetcher.submit(None, self.tbank.prefetch, self.val, wavid)
+
+    def init_audio(self, *kwargs):
+        """Imports the audio modules and opens the output stream of the session (parameters outputrate and outputchannels;
+        by default the rate of the output device and the channels of the first block's stimuli, from its manifest).
+        It runs after the first frame, so that neither delays the first screen.
+        """
+        global StimulusBank, DspBank, AudioEngine, stimulus_levels, Crossfader, Recorder, eventlog, LatencyMeter, Telemetry
+        if self.engine is not None:
+            return
+        from stimulusbank import StimulusBank
+        from masker import Masker
+        from snr import stimulus_levels, masker_level
+        from dsp import DspBank
+        import eventlog
+        from latency import LatencyMeter
+        from telemetry import Telemetry
+        from audioengine import AudioEngine
+        from backends import backend
+        from crossfade import Crossfader
+        from recorder import Recorder
+        from prefetch import Prefetcher
+
+        header = adjstimuli[0].header(1, adjstimuli[0].wavids[0])
+        chunk = audiochunk if quiet else min(audiochunk, maskerchunk)
+        if audiobackend == 'file':
+            os.makedirs(directory + 'results/', exist_ok=True)
+        sink = backend(audiobackend, directory + 'results/' + str(username) + '_output.wav', audiospeed, header.sampwidth)
+        self.engine = AudioEngine(outputrate, outputchannels or header.nchannels, chunk, sink)
+        logger.info("Output stream opened: backend " + audiobackend + ", rate " + str(self.engine.rate) + ", channels " + str(self.engine.nchannels)
+                    + ", float samples, chunk " + str(self.engine.chunk) + " (stimuli converted from rate "
+                    + str(header.framerate) + ", channels " + str(header.nchannels) + ", sample width " + str(header.sampwidth) + ")")
+        self.xfade = Crossfader(self.engine.rate, self.engine.nchannels, self.engine.chunk, fadelength, fadecurve)
+        self.latency = LatencyMeter(self.engine.latency)
+        if telemetry:
+            self.engine.telemetry = Telemetry(self.engine.rate)
+        if saveaudio:
+            self.recorder = Recorder(self.engine.rate, self.engine.nchannels, header.sampwidth, logger=logger)
+        if not quiet:
+            # decoded once, the masker sources only copy from memory
+            try:
+                self.noise = Masker(args.masker, maskerfade, self.engine.rate, self.engine.nchannels)
+            except (OSError, EOFError, wave.Error, ValueError) as error:
+                logger.error('Masker ' + args.masker + ': ' + str(error))
+                sys.exit('[ERROR] Masker ' + args.masker + ': ' + str(error))
+            self.seed = maskerseed or random.SystemRandom().randrange(1, 2**31)
+            self.offsets = random.Random(self.seed)
+            logger.info("Masker loaded: " + str(len(self.noise)) + " frames in the loop" + (", random start positions with seed "
+                        + str(self.seed) if maskeroffset else ""))
+            if snrs:
+                self.noise_level = masker_level(self.noise, args.masker)
+
+        self.prefetcher = Prefetcher(logger)
+        self.prefetch_block()
+
+        startup_phase('audio init')
+        startup_report()
+
+    def close_engine(self):
+        """Closes the output stream and writes the latency (and telemetry) files of the session next to its results.
+        """
+        if self.recorder is not None:
+            self.recorder.stop()
+            self.recorder = None
+        if self.engine is not None:
+            self.prefetcher.close()
+            self.engine.close()
+            if self.events is not None:
+                name = directory + 'results/' + str(username)
+                values = self.latency.save(name)
+                logger.info("Control-to-sound latency of " + str(self.latency.count) + " level changes (ms): "
+                            + ', '.join('p' + str(p) + ' %.1f' % v for p, v in values.items()) + " (" + name + "_latency*.csv)")
+                if self.engine.telemetry is not None:
+                    total = self.engine.telemetry.save(name + '_telemetry.json', self.engine.chunk)
+                    logger.info("Audio callback telemetry: " + str(total.callbacks) + " callbacks, " + str(total.underflows)
+                                + " output underflows, " + str(total.late) + " longer than their chunk, max load "
+                                + "%.2f" % total.max_load + " (" + name + "_telemetry.json)")
+            self.engine = None
+        if self.events is not None:
+            self.events.close()
+            self.events = None
+
     def start_audio(self, *kwargs):
-        """For the adjustment phase, it starts the masker and target speech signals simultaneously using different threads
+        """For the adjustment phase, it starts the masker and target speech signals simultaneously in the output stream
         or only the target speech signal if masker does not exist.
         """
         logger.info("function start_audio")
 
+        if saveaudio:
+            self.recorder.open(self.audiofile)
+
         if not quiet:
             self.noise_off = False
-            self.threads.append(threading.Thread(target=self.play_noise()))
+            self.play_noise()
 
-        self.threads.append(threading.Thread(target=self.play_speech()))
-        map(lambda x: x.start(), self.threads)
+        self.xfade.reset()
+        self.next_speech()
 
-    def play_speech(self):
-        """Target speech streaming.
+    def next_speech(self, *kwargs):
+        """Plays the next sentence of the adjustment phase once the gap has passed (or the audio of the trial starts).
+        The sentence is mapped at every level here, if it was not prefetched, so that the level changes in the audio
+        callback only slice it (see StimulusBank.prepare).
+        """
+        if self.bank is None:
+            return  # the block ended during the gap and its bank was released (see prefetch_block)
+        self.bank.prepare(self.adjustwavIds[self.next_wav % len(self.adjustwavIds)])
+        self.play_speech()
+        logger.info("function play_speech:" + self.audio_path + '/' + self.adjustwavIds[self.next_wav])
+        self.prefetch_speech()
+
+    def play_speech(self, level=None):
+        """Target speech streaming at the given level (the current one if None). It is also called by the audio
+        callback on a level change, so it does not log (the change is in the event log); its callers on the UI thread do.
         """
+        if level is None:
+            level = self.value
 
         prev_wav = self.next_wav
 
         if self.next_wav >= len(self.adjustwavIds):
             self.next_wav = 0
 
-        if not knob:
-            self.audio_path = args.adjustmentfolder[self.tmp_fid] + prefix + str(
-            self.value)
-        else:
-            self.audio_path = args.adjustmentfolder[self.tmp_fid] + prefix + str(
-            self.value)
+        self.audio_path = self.bank.levelpath(level)
 
         
-        self.wf = wave.open(
-            self.audio_path + '/' + self.adjustwavIds[self.next_wav],
-            'rb')
+        self.wf = self.bank.open(level, self.adjustwavIds[self.next_wav])
 
         if prev_wav == self.next_wav and self.iteration > 1:
             wav_len = self.wf.getnframes()
@@ -484,125 +728,85 @@ class SpeechAdjuster(RelativeLayout):
         self.prev_wav_len = self.wf.getnframes()
         self.wf.setpos(self.current_pos)
 
-        audiochunk_samples = int(audiochunk * self.wf.getframerate())
+        self.engine.target_gain = self.gains.get(self.adjustwavIds[self.next_wav], 1.)
+        self.engine.target = self.callback
 
-        logger.info("function play_speech:" + self.audio_path + '/' + self.adjustwavIds[self.next_wav])
-        self.stream_wf = self.p.open(format=self.p.get_format_from_width(self.wf.getsampwidth()),
-                                     channels=self.wf.getnchannels(),
-                                     rate=self.wf.getframerate(),
-                                     output=True,
-                                     stream_callback=self.callback, frames_per_buffer=audiochunk_samples)
-
-    def callback(self, in_data, frame_count, time_info, status):
+    def callback(self, out, frame_count, time_info):
+        """Target speech source of the output stream in the adjustment phase.
+        """
         self.count_frames =self.count_frames +1;
 
-        data = self.wf.readframes(frame_count)
-        # fade = int(frame_count / 2) # ramps half size of the chunk
-        fade = int(0.02*self.wf.getframerate()) # ramps of fixed size 20ms
-
-        if self.value_changed:
-            # data = np.fromstring(data, np.int16) # np.fromstring is depricated by np.frombuffer
-            data = np.frombuffer(bytearray(data), np.int16)
+        if self.changed is not None:
+            # first chunk of the new level
+            self.latency.add(self.changed[0], self.changed[1], time_info)
+            self.changed = None
 
-            self.data2 = self.wf2.readframes(frame_count)
-            if len(self.data2)>2*fade:
-                self.data2 = np.frombuffer(bytearray(self.data2), np.int16)
-                fade_out = np.arange(1., 0., -1 / fade)
-                self.data2[:fade] = np.multiply(self.data2[:fade], fade_out)
-
-            if len(data)>fade:
-                fade_in = np.arange(0., 1., 1 / fade)
-                data[:fade] = np.multiply(data[:fade], fade_in)
-                if len(self.data2) > 2*fade:
-                    data[:fade] = data[:fade]+self.data2[:fade]
-
-            # data=data.tostring()
-            data = data.tobytes()
-            self.value_changed = False
+        n = self.wf.read(out)
+        self.xfade.mix(out, n)
 
+        if saveaudio:
+            self.recorder.push(out[:n])
 
         if self.button_pressed and self.noise_off:
             self.button_pressed = False
+            self.engine.target = None
+            return
 
-            if saveaudio:
-                # save audio to a .wav file
-                wav_writer = wave.open('audio_tuning.wav', "wb")
-                wav_writer.setframerate(self.wf.getframerate())
-                wav_writer.setsampwidth(self.wf.getsampwidth())
-                wav_writer.setnchannels(1)
-
-                wav_writer.writeframes(self.data_append)
-                wav_writer.close()
-
-            return (data, pyaudio.paComplete)
-
-        if self.value != self.tmp:
+        # the level is read once per chunk: the input events since the previous chunk (see tag_input) are coalesced
+        # into at most one level change, and the UI changing self.value meanwhile does not split it
+        if knob:
+            self.value = int(math.floor(self.hyper_knob.value))
+        value = self.value
+        if value != self.tmp:
             # print('level changed at '+ "%.3f"%(self.count_frames*audiochunk) + 'sec') # uncomment for printing the time points that correspond to the listener's changes in the audio_tuning.wav file
 
-            self.wf2 = self.wf
+            self.xfade.switch(self.wf)
 
-            self.value_changed = True
             self.current_pos = self.wf.tell()
-            self.play_speech()
+            self.play_speech(value)
 
+            self.tmp = value
+            self.events.event(eventlog.LEVEL, value, self.engine.position)
+            level, input_ns = self.input
+            if level == value:
+                self.changed = (level, input_ns)
 
-            if not is_mac:
-                self.stream_wf.close()
-
-            self.tmp = self.value
-            self.write_txt("level = " + str(self.value))
-
-        if len(data) < 2*frame_count:
+        if n < frame_count:
             self.current_pos = 0;
             self.next_wav += 1
 
-            Clock.schedule_once(lambda x: self.play_speech(), gap)
+            self.engine.target = None
+            self.xfade.reset()
+            Clock.schedule_once(self.next_speech, gap)
             self.wf.close()
 
-            if not is_mac:
-                self.stream_wf.close()
-
-        self.data_append = np.append(self.data_append, data)
-
-        if knob:
-            self.value = int(math.floor(self.hyper_knob.value))
-
-        return data, pyaudio.paContinue
+    def start_noise(self):
+        """Sets the position the masker starts from: its beginning, or a random position (parameter maskeroffset)
+        written in the pID_results.txt file.
+        """
+        if maskeroffset:
+            offset = self.offsets.randrange(len(self.noise))
+            self.write_txt("Masker start: " + str(offset))
+        else:
+            offset = 0
+        self.noise.start(offset)
 
     def play_noise(self):
         """Masker's streaming.
         """
         logger.info("function play_noise")
 
-        self.noise = wave.open(
-                args.masker,
-                'rb')
-
-        maskerchunk_samples = int(maskerchunk * self.noise.getframerate())
+        self.start_noise()
+        self.engine.masker = self.callback_noise
 
-        self.stream_n = self.p_noise.open(format=self.p_noise.get_format_from_width(self.noise.getsampwidth()),
-                                          channels=self.noise.getnchannels(),
-                                          rate=self.noise.getframerate(),
-                                          output=True,
-                                          stream_callback=self.callback_noise, frames_per_buffer=maskerchunk_samples)
-
-    def callback_noise(self, in_data, frame_count, time_info, status):
-        data = self.noise.readframes(frame_count)
+    def callback_noise(self, out, frame_count, time_info):
+        """Masker source of the output stream in the adjustment phase.
+        """
+        self.noise.read(out)
 
         if self.button_pressed:
             self.noise_off = True
-
-            return (data, pyaudio.paComplete)
-
-        if len(data) < 2 * frame_count:
-            if not self.button_pressed:
-                Clock.schedule_once(lambda x: self.play_noise(), 0)
-                self.noise.close()
-
-                if not is_mac:
-                    self.stream_n.close()
-
-        return data, pyaudio.paContinue
+            self.engine.masker = None
 
     def enable_completion_button(self, *kwargs):
         """Enables the completion button in the adjustment phase.
@@ -621,6 +825,11 @@ class SpeechAdjuster(RelativeLayout):
         self.write_txt("end of adjusting")
         self.button_pressed = True
 
+        if saveaudio:
+            # closed from the UI, after the frames pushed until the button was pressed; the next trial's file is
+            # opened by start_audio, once this trial's target speech has stopped
+            self.recorder.close()
+
         if not knob:
             self.val = self.value
             self.button_down.background_color = [1, 1, 1, .3]
@@ -644,6 +853,7 @@ class SpeechAdjuster(RelativeLayout):
         self.on_adjustmentphase = False
 
         if testphase:
+            self.prefetch_tests()
             self.taudio_progress = 0
             self.test_label.color = [.9, .9, .9, 1]
             self.text_in.background_color = [.9, .9, .9, 1]
@@ -669,6 +879,7 @@ class SpeechAdjuster(RelativeLayout):
 
         if self.value < self.higherlevel:
             self.value += 1
+            self.tag_input()
             self.lower_lim.text = ''
             self.higher_lim.text = ''
 
@@ -684,6 +895,7 @@ class SpeechAdjuster(RelativeLayout):
 
         if self.value > lowerlevel:
             self.value -= 1
+            self.tag_input()
             self.lower_lim.text = ''
             self.higher_lim.text = ''
 
@@ -724,14 +936,14 @@ class SpeechAdjuster(RelativeLayout):
             else:
                 Clock.schedule_once(lambda x: self.tstart_audio(), testaudio)
 
-    def tcallback_speech(self, in_data, frame_count, time_info, status):
-        data = self.wf.readframes(frame_count)
+    def tcallback_speech(self, out, frame_count, time_info):
+        """Target speech source of the output stream in the test phase.
+        """
+        n = self.wf.read(out)
         
-        if len(data) < 2 * frame_count:
+        if n < frame_count:
             self.wf.close()
-            
-            if not is_mac:
-                self.stream_wf.close()
+            self.engine.target = None
             
             if self.count_phrases < numOftesting:
                 self.taudio_progress = 2
@@ -741,42 +953,26 @@ class SpeechAdjuster(RelativeLayout):
                 self.taudio_progress = 1
                 self.count_phrases = 1
 
-            self.write_txt("Audio: " + self.audio_path + '/' + self.testwavIds[self.testwavIds_i])
             self.testwavIds_i += 1
 
-            return data, pyaudio.paComplete
-
-        return data, pyaudio.paContinue
-
-    def tcallback_noise(self, in_data, frame_count, time_info, status):
-        data = self.noise.readframes(frame_count)
+    def tcallback_noise(self, out, frame_count, time_info):
+        """Masker source of the output stream in the test phase.
+        """
+        self.noise.read(out)
 
         if self.taudio_progress == 1 or self.tphrases == 1:
-            self.noise.close()
-
-            if not is_mac:
-                self.stream_n.close()
+            self.engine.masker = None
             self.tphrases = 0
 
-            return data, pyaudio.paComplete
-
-        if len(data) < (2 * frame_count):
-            Clock.schedule_once(lambda x: self.tstart_audio(), 0)
-
-        return data, pyaudio.paContinue
-
     def tstart_audio(self, *kwargs):
-        """For the test phase, it starts the masker and target speech signals simultaneously using different threads
+        """For the test phase, it starts the masker and target speech signals in the output stream
         or only the target speech signal if masker does not exist.
         """
         logger.info("function tstart_audio")
 
-        self.threads = []
-
         if not quiet:
             Clock.schedule_once(lambda x: self.tplay_speech(), speech_on)
-            self.threads.append(threading.Thread(target=self.tplay_noise()))
-            map(lambda x: x.start(), self.threads)
+            self.tplay_noise()
         else:
             self.tplay_speech()
 
@@ -785,17 +981,8 @@ class SpeechAdjuster(RelativeLayout):
         """
         logger.info("function tplay_noise")
 
-        self.noise = wave.open(
-                args.masker,
-                'rb')
-
-        maskerchunk_samples = int(maskerchunk * self.noise.getframerate())
-
-        self.stream_n = self.p_noise.open(format=self.p_noise.get_format_from_width(self.noise.getsampwidth()),
-                                          channels=self.noise.getnchannels(),
-                                          rate=self.noise.getframerate(),
-                                          output=True,
-                                          stream_callback=self.tcallback_noise, frames_per_buffer=maskerchunk_samples)
+        self.start_noise()
+        self.engine.masker = self.tcallback_noise
 
     def tplay_speech(self):
         """Target speech streaming.
@@ -805,21 +992,14 @@ class SpeechAdjuster(RelativeLayout):
         if self.testwavIds_i == len(self.testwavIds):
             self.testwavIds_i = 0
 
-        self.audio_path = args.testfolder[self.tmp_fid] + prefix + str(
-            self.val)
+        self.audio_path = self.tbank.levelpath(self.val)
 
         logger.info(self.audio_path + '/' + self.testwavIds[self.testwavIds_i])
-        self.wf = wave.open(
-            self.audio_path + '/' + self.testwavIds[self.testwavIds_i],
-            'rb')
-
-        audiochunk_samples = int(audiochunk * self.wf.getframerate())
-
-        self.stream_wf = self.p.open(format=self.p.get_format_from_width(self.wf.getsampwidth()),
-                                     channels=self.wf.getnchannels(),
-                                     rate=self.wf.getframerate(),
-                                     output=True,
-                                     stream_callback=self.tcallback_speech, frames_per_buffer=audiochunk_samples)
+        # written here rather than by the audio callback when the sentence ends, which only pushes fixed-size records
+        self.write_txt("Audio: " + self.audio_path + '/' + self.testwavIds[self.testwavIds_i])
+        self.wf = self.tbank.open(self.val, self.testwavIds[self.testwavIds_i])
+        self.engine.target_gain = self.tgains.get(self.testwavIds[self.testwavIds_i], 1.)
+        self.engine.target = self.tcallback_speech
 
     def update(self):
         """Manages the experiment's flow. It is called before each trial.
@@ -875,6 +1055,14 @@ class SpeechAdjuster(RelativeLayout):
                 self.i = 1
 
             self.write_txt("Trial no: " + str(self.trial_no) + " Starting level: " + str(self.value))
+            if self.snr is not None:
+                self.write_txt("SNR: " + str(self.snr))
+            if telemetry:
+                self.engine.telemetry.start(self.block_num, self.trial_no)
+            if saveaudio:
+                # the target speech of each trial is saved in its own file, opened when the trial's audio starts
+                self.audiofile = (directory + 'results/' + str(username) + '_block' + str(self.block_num) + '_trial'
+                                  + str(self.trial_no) + '_audio_tuning.wav')
             self.iteration += 1
             self.trial_no += 1
 
@@ -909,22 +1097,16 @@ class SpeechAdjuster(RelativeLayout):
                 Clock.schedule_once(self.starting_panel)
 
     def write_txt(self, tex):
-        """Writes information in the pID_results.txt file.
+        """Writes information in the pID_results.txt file (through the event log, see eventlog.py).
             A timestamp is also saved with the data.
            tex: Information to be added in the file
         """
-        filename = directory +'results/' + str(username) + "_results.txt"
+        if self.events is None:
+            if not os.path.exists(directory + 'results/'):
+                os.makedirs(directory+'results/')
+            self.events = eventlog.EventLog(directory +'results/' + str(username) + "_results.txt", logger=logger)
 
-        if not os.path.exists(directory + 'results/'):
-            os.makedirs(directory+'results/')
-
-        if os.path.exists(filename):
-            fob = open(directory +'results/' + str(username) + "_results.txt", 'a')
-        else:
-            fob = open(directory +'results/' + str(username) + "_results.txt", 'w')
-
-        fob.write(datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3] + "   ")
-        fob.write(tex + "\n")
+        self.events.write(tex)
 
     def starting_panel(self, *kwargs):
         """Sets instructions and starting button widgets on the screen. If the starting button is pressed,
@@ -941,6 +1123,10 @@ class SpeechAdjuster(RelativeLayout):
         self.add_widget(self.start_button)
         self.add_widget(self.instr_label)
 
+        # the first block's banks are prefetched once the output stream is opened (see init_audio)
+        if self.engine is not None:
+            self.prefetch_block()
+
     def ending_panel(self, *kwargs):
         """Sets an end message on the screen and exits the SpeechAdjuster.
         """
@@ -973,6 +1159,9 @@ class app(App):
     def build(self):
         return SpeechAdjuster()
 
+    def on_stop(self):
+        self.root.close_engine()
+
 def main(args=None):
     if args is None:
         args = sys.argv[1:]
@@ -0,0 +1,310 @@
+#######################################################
+## In-memory bank of the target speech stimuli of a block.
+#######################################################
+#######################################################
+## Author: Olympia Simantiraki
+## License: GNU GPL v3
+## Version: v1.0.0
+## Email: olina.simantiraki@gmail.com
+#######################################################
+
+import os
+import mmap
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from wavfile import memmap
+from pack import Archive
+from resample import convert, length
+
+# numpy sample type for each sample width (in bytes) that can be read in place; 24-bit samples are decoded (see decode)
+dtypes = {1: np.uint8, 2: np.int16, 4: np.int32}
+widths = (1, 2, 3, 4)
+
+
+def to_float(frames, out):
+    """Converts PCM frames to float samples in [-1, 1) written into out (no memory is allocated). Float frames
+    (already converted) are copied.
+    """
+    if frames.dtype.kind == 'f':
+        np.copyto(out, frames)
+        return
+    sampwidth = frames.dtype.itemsize
+    np.subtract(frames, 128 if sampwidth == 1 else 0, out=out, casting='unsafe')
+    np.multiply(out, np.float32(1. / 2 ** (8 * sampwidth - 1)), out=out)
+
+
+def decode(data, sampwidth, nchannels):
+    """Returns the PCM samples data (bytes or a uint8 array) of the given sample width as float samples
+    (frames x nchannels).
+    """
+    data = np.frombuffer(data, dtype=np.uint8)
+    if sampwidth == 3:
+        # 24-bit samples are shifted to the top of an int32
+        frames = np.zeros((len(data) // 3, 4), dtype=np.uint8)
+        frames[:, 1:] = data[:len(frames) * 3].reshape(-1, 3)
+        frames = frames.view('<i4')
+    else:
+        frames = data[:len(data) // sampwidth * sampwidth].view(np.dtype(dtypes[sampwidth]).newbyteorder('<'))
+    frames = frames.reshape(-1, nchannels)
+    out = np.empty(frames.shape, dtype=np.float32)
+    to_float(frames, out)
+    return out
+
+
+def to_pcm(samples, sampwidth, out=None):
+    """Converts float samples in [-1, 1] to PCM frames of the given sample width (for 24-bit samples, an array of
+    bytes with the same layout as the .wav file).
+    """
+    if sampwidth == 3:
+        frames = to_pcm(samples, 4).astype('<i4')
+        return frames.view(np.uint8).reshape(frames.shape + (4,))[..., 1:]
+    full = 2 ** (8 * sampwidth - 1)
+    if out is None:
+        out = np.empty(samples.shape, dtype=dtypes[sampwidth])
+    np.copyto(out, np.clip(samples * full + (128 if sampwidth == 1 else 0), -full if sampwidth > 1 else 0,
+                           full - 1 if sampwidth > 1 else 255), casting='unsafe')
+    return out
+
+
+def read_wave(wf, out):
+    """Reads the next frames of the wave.Wave_read object wf as float samples into out and returns the number of frames read.
+    """
+    frames = decode(wf.readframes(len(out)), wf.getsampwidth(), wf.getnchannels())
+    out[:len(frames)] = frames
+    return len(frames)
+
+
+class StimulusBank:
+    """Holds all the levels (prefix1..prefixN) of a target speech folder, converted to the format of the output stream.
+        In 'memory' mode the stimuli are decoded once, as float samples at the output's rate and number of channels,
+        in one contiguous array: the stimulus of level l with ID wavid is the slice
+        data[offsets[l-1, s]:offsets[l-1, s] + lengths[l-1, s]] where s is the index of wavid in wavids.
+        In 'mmap' mode the samples of the .wav files are memory-mapped. The files of a stimulus are mapped at all levels
+        the first time it is opened, so a level change is still only a slice. At most maxmapped stimuli stay mapped.
+        Files that are not in the output's format (or 24-bit) cannot be played from the mapping: the levels of such a
+        stimulus are converted when it is first opened and kept in place of the mapping.
+        The stimuli can also come from a stimulus archive (see pack.py); in 'mmap' mode the whole archive is then mapped once.
+        A stimulus is mapped before it is played (see prepare), or ahead of time by another thread (see prefetch), so that
+        the audio callback, which opens it again at every level change, only slices what is already mapped. The stimulus
+        being played is not unmapped to make room for the others.
+       stimuli: Index of the target speech folder or stimulus archive (see manifest.load_stimuli)
+       numlevels: Number of levels
+       wavids: Filenames of the stimuli
+       budget: Maximum memory (in bytes) the bank can allocate
+       mode: 'memory', 'mmap' or 'auto' ('memory' if the stimuli fit in the budget, 'mmap' otherwise)
+       rate, nchannels: Format of the output stream (see resample.py); the files' format if None
+    """
+
+    maxmapped = 8
+
+    def __init__(self, stimuli, numlevels, wavids, budget, mode='memory', rate=None, nchannels=None):
+        self.folder = folder = stimuli.path
+        self.prefix = stimuli.prefix
+        self.numlevels = numlevels
+        self.wavids = list(wavids)
+        self.index = {w: s for s, w in enumerate(self.wavids)}
+        self.lengths = np.zeros((numlevels, len(self.wavids)), dtype=np.int64)
+        self.offsets = np.zeros((numlevels, len(self.wavids)), dtype=np.int64)
+        self.headers = [[None] * len(self.wavids) for l in range(numlevels)]
+        self.archive = stimuli if isinstance(stimuli, Archive) else None
+
+        # the headers come from the index, so the footprint is known before anything is read
+        params = None
+        for l in range(numlevels):
+            for s, wavid in enumerate(self.wavids):
+                header = stimuli.header(l + 1, wavid)
+                p = (header.nchannels, header.sampwidth, header.framerate)
+                if params is None:
+                    params = p
+                elif p != params:
+                    raise ValueError('The file ' + self.path(l + 1, wavid) + ' has (channels, sample width, rate) ' + str(p)
+                                     + ' while ' + self.path(1, self.wavids[0]) + ' has ' + str(params) + '.')
+                self.headers[l][s] = header
+
+        # sampwidth stays the files' sample width, the width of the .wav files written from the bank (render.py)
+        self.filechannels, self.sampwidth, self.filerate = params
+        if self.sampwidth not in widths:
+            raise ValueError('Sample width of ' + str(self.sampwidth) + ' bytes is not supported (' + self.path(1, self.wavids[0]) + ').')
+        self.framerate = rate or self.filerate
+        self.nchannels = nchannels or self.filechannels
+        if self.filechannels != self.nchannels and 1 not in (self.filechannels, self.nchannels):
+            raise ValueError('The file ' + self.path(1, self.wavids[0]) + ' has ' + str(self.filechannels) + ' channels, it cannot '
+                             'be played on ' + str(self.nchannels) + ' channels.')
+        # the files can be played from their mapping
+        self.native = (self.filerate, self.filechannels) == (self.framerate, self.nchannels) and self.sampwidth in dtypes
+        for l in range(numlevels):
+            for s in range(len(self.wavids)):
+                self.lengths[l, s] = length(self.headers[l][s].nframes, self.filerate, self.framerate)
+
+        self.size = int(self.lengths.sum()) * self.nchannels * 4
+        if mode == 'auto':
+            mode = 'memory' if self.size <= budget else 'mmap'
+        self.mode = mode
+
+        if mode == 'mmap':
+            self.nbytes = 0
+            self.mapped = OrderedDict()
+            self.playing = None
+            self.lock = threading.Lock()
+            if self.archive:
+                self.archivemap = np.memmap(folder, dtype=np.uint8, mode='r')
+            return
+
+        self.nbytes = self.size
+        if self.nbytes > budget:
+            raise ValueError('The stimuli in ' + folder + ' need ' + str(round(self.nbytes / 2**20, 1)) + ' MB, more than the '
+                             'bank budget of ' + str(round(budget / 2**20, 1)) + ' MB (parameter bankbudget in config.ini).')
+
+        self.offsets.flat[1:] = np.cumsum(self.lengths.flat)[:-1]
+        self.data = np.empty((int(self.lengths.sum()), self.nchannels), dtype=np.float32)
+
+        archive = open(folder, 'rb') if self.archive else None
+        for l in range(numlevels):
+            for s, wavid in enumerate(self.wavids):
+                start = self.offsets[l, s]
+                header = self.headers[l][s]
+                f = archive or open(self.path(l + 1, wavid), 'rb')
+                f.seek(header.offset)
+                data = f.read(header.nframes * header.nchannels * header.sampwidth)
+                if not archive:
+                    f.close()
+                self.data[start:start + self.lengths[l, s]] = self.convert(data)
+        if archive:
+            archive.close()
+
+    def convert(self, data):
+        """Returns the PCM samples data of a file of the bank as float samples in the output's format.
+        """
+        return convert(decode(data, self.sampwidth, self.filechannels), self.filerate, self.framerate, self.nchannels)
+
+    def levelpath(self, level):
+        """Path of the given level's folder (archive:prefixN for an archive).
+        """
+        if self.archive:
+            return self.folder + ':' + self.prefix + str(level)
+        return os.path.join(self.folder, self.prefix + str(level))
+
+    def path(self, level, wavid):
+        return self.levelpath(level) + '/' + wavid
+
+    def stimulus(self, level, wavid):
+        """Returns the frames of the stimulus wavid at the given level (a view, nothing is copied once the stimulus
+        has been prepared or prefetched): float samples, or PCM frames of a file mapped in the output's format.
+        """
+        s = self.index[wavid]
+        if self.mode == 'memory':
+            start = self.offsets[level - 1, s]
+            return self.data[start:start + self.lengths[level - 1, s]]
+
+        if self.archive and self.native:
+            header = self.headers[level - 1][s]
+            nbytes = header.nframes * header.nchannels * header.sampwidth
+            return self.archivemap[header.offset:header.offset + nbytes].view(dtypes[self.sampwidth]).reshape(-1, self.nchannels)
+
+        return self._map(wavid)[level - 1]
+
+    def _map(self, wavid):
+        """Returns the frames of the stimulus wavid at every level, mapped (or converted) if they are not yet.
+        """
+        with self.lock:
+            levels = self.mapped.get(wavid)
+            if levels is not None:
+                self.mapped.move_to_end(wavid)
+                return levels
+
+        # mapped (or converted) outside the lock, so that the other thread is not kept waiting
+        s = self.index[wavid]
+        if self.native:
+            levels = [memmap(self.path(l + 1, wavid), self.headers[l][s], dtypes[self.sampwidth])
+                      for l in range(self.numlevels)]
+        else:
+            levels = [self.convert(self._pcm(l + 1, s)) for l in range(self.numlevels)]
+        with self.lock:
+            levels = self.mapped.setdefault(wavid, levels)
+            self.mapped.move_to_end(wavid)
+            # the least recently used stimuli are unmapped first, never the one being played
+            for old in [w for w in self.mapped if w != self.playing][:max(len(self.mapped) - self.maxmapped, 0)]:
+                del self.mapped[old]
+        return levels
+
+    def prepare(self, wavid):
+        """Maps (or converts) the stimulus wavid at every level before it is played, if it was not prefetched, and keeps
+        it mapped until the next stimulus is prepared. Nothing is done in 'memory' mode.
+        """
+        if self.mode == 'memory' or (self.archive and self.native):
+            return
+        self.playing = wavid
+        self._map(wavid)
+
+    def prefetch(self, level, wavid):
+        """Maps (or converts) the stimulus wavid and reads one byte of every page of its given level, so that the
+        operating system has its samples in memory before it is played. Nothing is done in 'memory' mode.
+        """
+        if self.mode == 'memory':
+            return
+        frames = self.stimulus(level, wavid)
+        if frames.size:
+            frames.reshape(-1).view(np.uint8)[::mmap.PAGESIZE].sum()
+
+    def _pcm(self, level, s):
+        """PCM samples (bytes) of the file of level with index s, from the mapping of the file or of the archive.
+        """
+        header = self.headers[level - 1][s]
+        nbytes = header.nframes * header.nchannels * header.sampwidth
+        if self.archive:
+            return self.archivemap[header.offset:header.offset + nbytes]
+        return memmap(self.path(level, self.wavids[s]), header._replace(nframes=nbytes, nchannels=1), np.uint8)[:, 0]
+
+    def open(self, level, wavid):
+        """Returns a reader of the stimulus wavid at the given level with the same interface as wave.open(path, 'rb').
+        """
+        return BankReader(self, self.stimulus(level, wavid))
+
+
+class BankReader:
+    """Drop-in replacement of the wave.Wave_read object for a stimulus held in a StimulusBank.
+        Reading and seeking only move a position within the bank's memory.
+    """
+
+    def __init__(self, bank, frames):
+        self.bank = bank
+        self.frames = frames
+        self.pos = 0
+
+    def readframes(self, n):
+        data = self.frames[self.pos:self.pos + n]
+        self.pos += len(data)
+        if data.dtype.kind == 'f':
+            return to_pcm(data, self.bank.sampwidth).tobytes()
+        return data.tobytes()
+
+    def read(self, out):
+        """Reads the next frames as float samples into out and returns the number of frames read.
+        """
+        data = self.frames[self.pos:self.pos + len(out)]
+        self.pos += len(data)
+        to_float(data, out[:len(data)])
+        return len(data)
+
+    def tell(self):
+        return self.pos
+
+    def setpos(self, pos):
+        self.pos = min(max(int(pos), 0), len(self.frames))
+
+    def getnframes(self):
+        return len(self.frames)
+
+    def getframerate(self):
+        return self.bank.framerate
+
+    def getsampwidth(self):
+        return self.bank.sampwidth
+
+    def getnchannels(self):
+        return self.bank.nchannels
+
+    def close(self):
+        pass
@@ -0,0 +1,117 @@
+#######################################################
+## Timing and underrun telemetry of the audio callback
+## (parameter telemetry).
+#######################################################
+#######################################################
+## Author: Olympia Simantiraki
+## License: GNU GPL v3
+## Version: v1.0.0
+## Email: olina.simantiraki@gmail.com
+#######################################################
+
+import json
+
+# PortAudio status flags of the stream callback (pyaudio.paOutputUnderflow etc.)
+OUTPUT_UNDERFLOW = 0x4
+OUTPUT_OVERFLOW = 0x8
+PRIMING_OUTPUT = 0x10
+
+# histogram of the load (duration of the callback / duration of the chunk): bins of 1/LOADSTEP, the last one open
+LOADSTEP = 20
+LOADBINS = 2 * LOADSTEP + 1
+# histogram of the queue depth (audio buffered ahead of the DAC, in chunks): bins of 1/DEPTHSTEP, the last one open
+DEPTHSTEP = 4
+DEPTHBINS = 8 * DEPTHSTEP + 1
+
+
+class Stats:
+    """Counters and histograms of the callbacks of one trial.
+    """
+    __slots__ = ('callbacks', 'underflows', 'overflows', 'priming', 'late', 'max_load', 'load', 'depth')
+
+    def __init__(self):
+        self.callbacks = 0
+        self.underflows = 0
+        self.overflows = 0
+        self.priming = 0
+        self.late = 0       # callbacks that took longer than their chunk
+        self.max_load = 0.
+        self.load = [0] * LOADBINS
+        self.depth = [0] * DEPTHBINS
+
+    def add(self, other):
+        for name in ('callbacks', 'underflows', 'overflows', 'priming', 'late'):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.max_load = max(self.max_load, other.max_load)
+        self.load = [a + b for a, b in zip(self.load, other.load)]
+        self.depth = [a + b for a, b in zip(self.depth, other.depth)]
+
+    def todict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class Telemetry:
+    """Records for every call of the output stream's callback its duration against the duration of the chunk
+        (the budget), the PortAudio status flags and the queue depth (output_buffer_dac_time - current_time).
+        The callback only increments counters of the current trial's Stats, which the UI replaces when a trial starts.
+       rate: Sample rate of the output stream
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.trials = {}  # (block, trial) -> Stats
+        self.current = Stats()
+        self.trials[(0, 0)] = self.current  # callbacks before the first trial
+
+    def start(self, block, trial):
+        """The callbacks from now on belong to the given trial.
+        """
+        stats = Stats()
+        self.trials[(block, trial)] = stats
+        self.current = stats
+
+    def record(self, frame_count, duration_ns, status, time_info):
+        """Called from the audio callback with its duration (time.perf_counter_ns()).
+        """
+        stats = self.current
+        stats.callbacks += 1
+        if status:
+            if status & OUTPUT_UNDERFLOW:
+                stats.underflows += 1
+            if status & OUTPUT_OVERFLOW:
+                stats.overflows += 1
+            if status & PRIMING_OUTPUT:
+                stats.priming += 1
+
+        budget = frame_count / self.rate
+        load = duration_ns / 1e9 / budget
+        if load > 1:
+            stats.late += 1
+        if load > stats.max_load:
+            stats.max_load = load
+        stats.load[min(int(load * LOADSTEP), LOADBINS - 1)] += 1
+
+        dac, current = time_info.get('output_buffer_dac_time', 0), time_info.get('current_time', 0)
+        if dac and current:
+            stats.depth[min(max(int((dac - current) / budget * DEPTHSTEP), 0), DEPTHBINS - 1)] += 1
+
+    def save(self, filename, chunk):
+        """Writes the statistics of every trial, the totals of every block and of the session to filename (JSON).
+        Returns the totals of the session.
+        """
+        blocks = {}
+        total = Stats()
+        for (block, trial), stats in sorted(self.trials.items()):
+            if block not in blocks:
+                blocks[block] = {'trials': {}, 'total': Stats()}
+            blocks[block]['trials'][str(trial)] = stats.todict()
+            blocks[block]['total'].add(stats)
+            total.add(stats)
+
+        with open(filename, 'w') as f:
+            json.dump({'rate': self.rate, 'chunk': chunk, 'budget_ms': 1000 * chunk / self.rate,
+                       'load_edges': [i / LOADSTEP for i in range(LOADBINS)],
+                       'depth_edges_chunks': [i / DEPTHSTEP for i in range(DEPTHBINS)],
+                       'blocks': {str(b): {'trials': v['trials'], 'total': v['total'].todict()} for b, v in blocks.items()},
+                       'total': total.todict()}, f, indent=1)
+        return total
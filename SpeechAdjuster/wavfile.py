@@ -0,0 +1,66 @@
+#######################################################
+## Reading of PCM .wav files: header parsing and
+## memory-mapped access to the samples.
+#######################################################
+#######################################################
+## Author: Olympia Simantiraki
+## License: GNU GPL v3
+## Version: v1.0.0
+## Email: olina.simantiraki@gmail.com
+#######################################################
+
+import os
+import struct
+from collections import namedtuple
+
+# offset: position (in bytes) of the first sample in the file
+WavHeader = namedtuple('WavHeader', ['nchannels', 'sampwidth', 'framerate', 'nframes', 'offset'])
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+def read_header(path):
+    """Parses the RIFF header of the PCM .wav file path up to the beginning of its data chunk.
+    """
+    with open(path, 'rb') as f:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] != b'RIFF' or riff[8:12] != b'WAVE':
+            raise ValueError('The file ' + path + ' is not a RIFF/WAVE file.')
+
+        fmt = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                raise ValueError('The file ' + path + ' has no data chunk.')
+            cid, size = chunk[:4], struct.unpack('<I', chunk[4:])[0]
+
+            if cid == b'fmt ':
+                body = f.read(size + size % 2)
+                tag, nchannels, framerate, _, _, bits = struct.unpack('<HHIIHH', body[:16])
+                if tag == WAVE_FORMAT_EXTENSIBLE and size >= 26:
+                    tag = struct.unpack('<H', body[24:26])[0]
+                if tag != WAVE_FORMAT_PCM:
+                    raise ValueError('The file ' + path + ' is not PCM (format ' + hex(tag) + ').')
+                fmt = (nchannels, (bits + 7) // 8, framerate)
+            elif cid == b'data':
+                if fmt is None:
+                    raise ValueError('The file ' + path + ' has no fmt chunk before its data chunk.')
+                offset = f.tell()
+                # some writers leave the size of the data chunk unset, the samples then end with the file
+                size = min(size, os.fstat(f.fileno()).st_size - offset)
+                nchannels, sampwidth, framerate = fmt
+                return WavHeader(nchannels, sampwidth, framerate, size // (nchannels * sampwidth), offset)
+            else:
+                f.seek(size + size % 2, 1)
+
+
+def memmap(path, header, dtype):
+    """Maps the samples of the .wav file path (nframes x nchannels array of the given dtype). Nothing is read:
+        the pages are loaded by the OS on access and shared with other processes mapping the same file.
+    """
+    import numpy as np  # imported here so that validating the stimuli (manifest.py) does not import numpy
+
+    if header.nframes == 0:
+        return np.zeros((0, header.nchannels), dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=header.offset, shape=(header.nframes, header.nchannels))
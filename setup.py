@@ -19,7 +19,7 @@ setup(
     download_url = 'https://github.com/osimantir/speechadjuster/archive/v1.0.0.tar.gz',
     keywords = [],
     classifiers = [],
-    python_requires='>=3.6',
+    python_requires='>=3.7',
     install_requires=['numpy>=1.19.5','pandas>=1.1.5', 'pyaudio>=0.2.11', 'Cython>=0.29.22','kivy>=1.10', 'matplotlib>=3.3.4'
       ],
     # long_description=long_description,
@@ -27,7 +27,11 @@ setup(
     entry_points={
         "console_scripts": [
             "speechadjuster = SpeechAdjuster.speechadjuster:main", 
-            "results = SpeechAdjuster.results:main"
+            "results = SpeechAdjuster.results:main",
+            "speechadjuster-pack = SpeechAdjuster.pack:main",
+            "speechadjuster-compact = SpeechAdjuster.resultstore:main",
+            "speechadjuster-dspbench = SpeechAdjuster.dsp:main",
+            "speechadjuster-render = SpeechAdjuster.render:main"
         ]
     },
 )
@@ -0,0 +1,34 @@
+import os
+import sys
+import wave
+import numpy as np
+import pytest
+
+# the modules of the tool import each other by name (see speechadjuster.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'SpeechAdjuster'))
+
+
+def write_wav(path, samples, rate=16000, sampwidth=2):
+    """Writes the float samples (frames x channels) to a PCM .wav file.
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    if samples.ndim == 1:
+        samples = samples[:, np.newaxis]
+    with wave.open(str(path), 'wb') as wf:
+        wf.setnchannels(samples.shape[1])
+        wf.setsampwidth(sampwidth)
+        wf.setframerate(rate)
+        wf.writeframes(np.round(samples * 32767).astype('<i2').tobytes())
+
+
+@pytest.fixture
+def stimuli_folder(tmp_path):
+    """A target speech folder with the levels level_1..level_3, each with the stimuli a.wav and b.wav (mono, 16 kHz).
+    The samples of stimulus s at level l are all l / 10 (a) or -l / 10 (b).
+    """
+    folder = tmp_path / 'adjustment'
+    for level in range(1, 4):
+        (folder / ('level_' + str(level))).mkdir(parents=True)
+        write_wav(folder / ('level_' + str(level)) / 'a.wav', np.full(1600, level / 10))
+        write_wav(folder / ('level_' + str(level)) / 'b.wav', np.full(800, -level / 10))
+    return folder
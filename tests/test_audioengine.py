@@ -0,0 +1,99 @@
+import numpy as np
+
+from audioengine import AudioEngine
+from backends import FileBackend, NullBackend
+from manifest import load_stimuli
+from stimulusbank import StimulusBank
+
+
+class Capture(NullBackend):
+    """Null sink that keeps the chunks it pulls.
+    """
+
+    def __init__(self, rate=16000):
+        super().__init__(None, rate)
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(np.frombuffer(data, dtype=np.float32).reshape(-1, self.nchannels))
+
+    def output(self):
+        return np.concatenate(self.chunks)
+
+
+def constant(value):
+    def source(out, frame_count, time_info):
+        assert out.shape[0] == frame_count
+        assert time_info['output_buffer_dac_time'] > time_info['current_time']
+        out[:] = value
+    return source
+
+
+def test_mix_of_the_sources():
+    backend = Capture()
+    engine = AudioEngine(None, 2, 0.01, backend)
+    assert (engine.rate, engine.chunk) == (16000, 160)
+    assert engine.latency == 0.01
+
+    backend.pull()
+    np.testing.assert_array_equal(backend.output(), 0)
+
+    engine.target = constant(.25)
+    engine.masker = constant(.125)
+    engine.target_gain = 2.
+    backend.pull(2)
+    np.testing.assert_allclose(backend.chunks[1], .625)
+    np.testing.assert_allclose(backend.chunks[2], .625)
+
+    # the mix is clipped to [-1, 1]
+    engine.masker_gain = 8.
+    backend.pull()
+    np.testing.assert_array_equal(backend.chunks[3], 1)
+
+    engine.target = None
+    engine.masker = None
+    backend.pull()
+    np.testing.assert_array_equal(backend.chunks[4], 0)
+    assert engine.position == backend.frames == 5 * 160
+    engine.close()
+
+
+def test_stimulus_played_from_the_bank(stimuli_folder, tmp_path, monkeypatch):
+    import manifest
+    monkeypatch.setattr(manifest, 'cachedir', str(tmp_path / 'cache'))
+
+    # the bank converts the 16 kHz mono stimuli to the 48 kHz stereo output stream
+    backend = Capture(48000)
+    engine = AudioEngine(None, 2, 0.01, backend)
+    stimuli = load_stimuli(str(stimuli_folder), 'level_')
+    for mode in ('memory', 'mmap'):
+        bank = StimulusBank(stimuli, stimuli.numlevels, stimuli.wavids, 2**20, mode, engine.rate, engine.nchannels)
+        reader = bank.open(2, 'a.wav')
+        assert reader.getnframes() == 4800
+
+        def target(out, frame_count, time_info):
+            reader.read(out)
+
+        engine.target = target
+        backend.chunks = []
+        backend.pull(12)
+        out = backend.output()
+        # 1600 frames at 16 kHz: 0.1 s, 10 chunks of sound and then silence
+        np.testing.assert_allclose(out[480:4320], .2, atol=1e-3)
+        np.testing.assert_array_equal(out[4800:], 0)
+    engine.close()
+
+
+def test_file_sink(tmp_path):
+    import wave
+
+    filename = str(tmp_path / 'out.wav')
+    backend = FileBackend(filename, 2, None, 16000)
+    engine = AudioEngine(None, 1, 0.01, backend)
+    engine.target = constant(.5)
+    backend.pull(3)
+    engine.close()
+    with wave.open(filename) as wf:
+        assert (wf.getnchannels(), wf.getframerate(), wf.getnframes()) == (1, 16000, 480)
+        samples = np.frombuffer(wf.readframes(480), dtype='<i2')
+    assert np.abs(samples / 32767 - .5).max() < 1e-3
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from crossfade import Crossfader, ramps
+
+RATE = 16000
+CHUNK = 64
+
+
+class Reader:
+    """Reader of constant samples (see stimulusbank.BankReader.read).
+    """
+
+    def __init__(self, value, frames=RATE):
+        self.frames = np.full((frames, 1), value, dtype=np.float32)
+        self.pos = 0
+
+    def read(self, out):
+        data = self.frames[self.pos:self.pos + len(out)]
+        out[:len(data)] = data
+        self.pos += len(data)
+        return len(data)
+
+
+def play(values, switches, chunks, length=0.02, curve='linear'):
+    """Plays the readers of values in turn, switching to the next one at the chunks in switches, as the callback of
+    the adjustment phase does. Returns the output samples.
+    """
+    xfade = Crossfader(RATE, 1, CHUNK, length, curve)
+    readers = [Reader(v) for v in values]
+    current = 0
+    out = []
+    for c in range(chunks):
+        if c in switches:
+            xfade.switch(readers[current])
+            current += 1
+        buf = np.zeros((CHUNK, 1), dtype=np.float32)
+        n = readers[current].read(buf)
+        xfade.mix(buf, n)
+        out.append(buf[:n, 0].copy())
+    return np.concatenate(out)
+
+
+def test_ramps_are_complementary():
+    fade_in, fade_out = ramps(RATE, 0.02, 'linear')
+    assert len(fade_in) == len(fade_out) == 320
+    np.testing.assert_allclose(fade_in + fade_out, 1, atol=1e-6)
+
+    fade_in, fade_out = ramps(RATE, 0.02, 'equalpower')
+    np.testing.assert_allclose(fade_in ** 2 + fade_out ** 2, 1, atol=1e-6)
+
+    with pytest.raises(ValueError):
+        ramps(RATE, 0.02, 'cubic')
+
+
+def test_switch_is_continuous():
+    out = play([.5, 1.], {3}, 20)
+    length = 320
+    np.testing.assert_allclose(out[:3 * CHUNK + 1], .5)
+    np.testing.assert_allclose(out[3 * CHUNK + length:], 1.)
+    # the fade moves from one level to the other without a step
+    assert np.abs(np.diff(out)).max() <= .5 / length + 1e-6
+
+
+def test_switch_during_a_fade_is_continuous():
+    # the second change arrives half-way through the first fade: the reader being faded in fades out from its gain
+    out = play([.5, 1., .25], {3, 5}, 30)
+    length = 320
+    assert np.abs(np.diff(out)).max() <= (.5 + 1. + .25) / length + 1e-6
+    np.testing.assert_allclose(out[-CHUNK:], .25)
+
+
+def test_more_changes_than_voices():
+    values = [.1 * (i + 1) for i in range(8)]
+    out = play(values, set(range(1, 8)), 20)
+    assert np.isfinite(out).all()
+    assert np.abs(out).max() <= sum(values)
+    np.testing.assert_allclose(out[-CHUNK:], values[-1])
+
+
+def test_reset_drops_the_fades():
+    xfade = Crossfader(RATE, 1, CHUNK)
+    xfade.switch(Reader(1.))
+    xfade.reset()
+    buf = np.full((CHUNK, 1), .5, dtype=np.float32)
+    xfade.mix(buf, CHUNK)
+    np.testing.assert_allclose(buf, .5)
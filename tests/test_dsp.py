@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+import manifest
+from conftest import write_wav
+from dsp import DspBank
+
+RATE = 48000
+
+
+@pytest.fixture
+def sources(tmp_path, monkeypatch):
+    """A folder of unprocessed stimuli with a 220 Hz sine of 2 seconds at 16 kHz, rendered at 25 levels.
+    """
+    monkeypatch.setattr(manifest, 'cachedir', str(tmp_path / 'cache'))
+    (tmp_path / 'sources').mkdir()
+    t = np.arange(32000) / 16000
+    write_wav(tmp_path / 'sources' / 'a.wav', .25 * np.sin(2 * np.pi * 220 * t))
+    return manifest.load_stimuli(str(tmp_path / 'sources'), '', 25)
+
+
+def render(bank, level, chunk=4800):
+    """Reads the stimulus at the given level in chunks, as the audio callback does.
+    """
+    reader = bank.open(level, 'a.wav')
+    out = np.zeros((reader.getnframes(), bank.nchannels), dtype=np.float32)
+    for start in range(0, len(out), chunk):
+        reader.read(out[start:start + chunk])
+    return out[RATE // 10:-RATE // 10, 0]
+
+
+def peak(x):
+    return np.argmax(np.abs(np.fft.rfft(x * np.hanning(len(x))))) * RATE / len(x)
+
+
+@pytest.mark.parametrize('feature', ['gain', 'tilt', 'pitch'])
+def test_middle_level_is_the_stimulus(sources, feature):
+    bank = DspBank(sources, 25, sources.wavids, float('inf'), 'memory', feature, -12., 12., RATE)
+    assert bank.framerate == RATE
+    assert bank.levels.label(13) == feature + '=0' + {'gain': 'dB', 'tilt': 'dB/oct', 'pitch': 'st'}[feature]
+    reference = bank.stimulus(1, 'a.wav')[RATE // 10:-RATE // 10, 0]
+    np.testing.assert_allclose(render(bank, 13), reference, atol=1e-4)
+
+
+def test_gain(sources):
+    bank = DspBank(sources, 25, sources.wavids, float('inf'), 'memory', 'gain', -12., 12., RATE)
+    reference = bank.stimulus(1, 'a.wav')[RATE // 10:-RATE // 10, 0]
+    np.testing.assert_allclose(render(bank, 1), reference * 10 ** (-12 / 20), atol=1e-4)
+
+
+def test_pitch_shift_by_an_octave(sources):
+    bank = DspBank(sources, 25, sources.wavids, float('inf'), 'mmap', 'pitch', -12., 12., RATE)
+    assert abs(peak(render(bank, 25)) - 440) < 5
+    assert abs(peak(render(bank, 1)) - 110) < 5
@@ -0,0 +1,51 @@
+import csv
+import logging
+import re
+import time
+
+import eventlog
+from eventlog import EventLog
+
+
+def lines(filename):
+    with open(filename) as f:
+        return f.read().splitlines()
+
+
+def test_text_and_csv(tmp_path):
+    filename = str(tmp_path / 'p1_results.txt')
+    log = EventLog(filename, period=0.01)
+    log.write('Trial no: 1 Starting level: 3')
+    log.event(eventlog.LEVEL, 4, 1600)
+    log.input(5, time.monotonic_ns())
+    log.event(eventlog.LEVEL, 5, 3200)
+    log.write('end of adjusting')
+    log.close()
+
+    # the format of the previous versions, without the input events
+    text = lines(filename)
+    assert all(re.match(r'^\d{4}-\d\d-\d\d \d\d:\d\d:\d\d\.\d{3}   ', line) for line in text)
+    assert [line.split('   ', 1)[1] for line in text] == ['Trial no: 1 Starting level: 3', 'level = 4', 'level = 5',
+                                                           'end of adjusting']
+
+    with open(str(tmp_path / 'p1_events.csv')) as f:
+        rows = list(csv.DictReader(f))
+    assert [r['type'] for r in rows] == ['text', 'level', 'input', 'level', 'text']
+    assert [r['level'] for r in rows] == ['-1', '4', '5', '5', '-1']
+    assert [r['position'] for r in rows if r['type'] == 'level'] == ['1600', '3200']
+    assert [int(r['ns']) for r in rows] == sorted(int(r['ns']) for r in rows)
+
+
+def test_full_ring_buffer_drops_records(tmp_path, caplog):
+    filename = str(tmp_path / 'p1_results.txt')
+    log = EventLog(filename, size=4, period=60, logger=logging.getLogger('test_eventlog'))
+    for level in range(1, 7):
+        log.event(eventlog.LEVEL, level, 0)
+    assert log.dropped == 2
+    with caplog.at_level(logging.WARNING):
+        log.close()
+    # the drops are counted by the callback only and reported once by the writer
+    assert log.dropped == 2
+    assert [r.getMessage() for r in caplog.records] == ['Event log: 2 events dropped']
+
+    assert [line.split('   ')[1] for line in lines(filename)] == ['level = ' + str(l) for l in range(1, 5)]
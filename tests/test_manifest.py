@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+import manifest
+from conftest import write_wav
+
+
+@pytest.fixture(autouse=True)
+def cachedir(tmp_path, monkeypatch):
+    monkeypatch.setattr(manifest, 'cachedir', str(tmp_path / 'cache'))
+
+
+def test_build(stimuli_folder):
+    m = manifest.build(str(stimuli_folder), 'level_')
+    assert m.numlevels == 3
+    assert m.wavids == ['a.wav', 'b.wav']
+    header = m.header(2, 'b.wav')
+    assert (header.nchannels, header.sampwidth, header.framerate, header.nframes) == (1, 2, 16000, 800)
+
+
+def test_load_uses_the_cache(stimuli_folder, monkeypatch):
+    first = manifest.load(str(stimuli_folder), 'level_')
+    assert os.path.exists(manifest._cachefile(str(stimuli_folder), 'level_'))
+
+    def build(path, prefix):
+        raise AssertionError('the manifest should come from the cache')
+
+    monkeypatch.setattr(manifest, 'build', build)
+    cached = manifest.load(str(stimuli_folder), 'level_')
+    assert cached.headers == first.headers
+    assert cached.mtimes == first.mtimes
+
+
+def test_changed_folder_is_scanned_again(stimuli_folder):
+    manifest.load(str(stimuli_folder), 'level_')
+    for level in range(1, 4):
+        path = stimuli_folder / ('level_' + str(level))
+        write_wav(path / 'c.wav', [0.] * 10)
+        stat = os.stat(str(path))
+        os.utime(str(path), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert manifest.load(str(stimuli_folder), 'level_').wavids == ['a.wav', 'b.wav', 'c.wav']
+
+
+def test_invalid_folders(stimuli_folder):
+    (stimuli_folder / 'other').mkdir()
+    with pytest.raises(ValueError):
+        manifest.load(str(stimuli_folder), 'level_')
+    (stimuli_folder / 'other').rmdir()
+
+    os.remove(str(stimuli_folder / 'level_2' / 'b.wav'))
+    with pytest.raises(ValueError):
+        manifest.build(str(stimuli_folder), 'level_')
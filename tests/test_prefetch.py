@@ -0,0 +1,63 @@
+import logging
+import threading
+
+import pytest
+
+from prefetch import Prefetcher
+
+
+def test_result_of_a_submitted_job():
+    prefetcher = Prefetcher()
+    calls = []
+    prefetcher.submit('block', lambda x: calls.append(x) or x * 2, 21)
+    prefetcher.submit('block', lambda x: calls.append(x) or x * 2, 0)  # already submitted
+    assert prefetcher.result('block', lambda x: -1, 0) == 42
+    assert calls == [21]
+    # a job that was not submitted is run by result()
+    assert prefetcher.result('block', lambda x: x + 1, 1) == 2
+    prefetcher.close()
+
+
+def test_exceptions():
+    prefetcher = Prefetcher()
+
+    def fail():
+        raise ValueError('missing file')
+
+    prefetcher.submit('block', fail)
+    with pytest.raises(ValueError):
+        prefetcher.result('block', fail)
+    prefetcher.close()
+
+
+def test_failed_job_without_key_is_logged(caplog):
+    prefetcher = Prefetcher(logging.getLogger('test_prefetch'))
+    done = threading.Event()
+
+    def fail():
+        raise OSError('missing file')
+
+    with caplog.at_level(logging.WARNING):
+        prefetcher.submit(None, fail)
+        prefetcher.submit(None, done.set)
+        assert done.wait(5)
+        prefetcher.close()
+    assert 'missing file' in caplog.text
+    assert not prefetcher.pending
+
+
+def test_close_cancels_the_jobs_not_started():
+    prefetcher = Prefetcher()
+    started, release = threading.Event(), threading.Event()
+    ran = []
+    prefetcher.submit(None, lambda: started.set() or release.wait(5))
+    assert started.wait(5)
+    prefetcher.submit(None, ran.append, 1)
+    prefetcher.submit('block', ran.append, 2)
+    pending = list(prefetcher.pending) + list(prefetcher.futures.values())
+
+    prefetcher.close()
+    release.set()
+    prefetcher.executor.shutdown(wait=True)
+    assert ran == []
+    assert sum(future.cancelled() for future in pending) == 2
@@ -0,0 +1,70 @@
+import logging
+import wave
+
+import numpy as np
+
+from recorder import Recorder
+
+
+def frames(filename):
+    with wave.open(filename) as wf:
+        return np.frombuffer(wf.readframes(wf.getnframes()), dtype='<i2').reshape(-1, wf.getnchannels())
+
+
+def chunk(value, n=480, nchannels=2):
+    return np.full((n, nchannels), value, dtype=np.float32)
+
+
+def test_each_file_gets_the_frames_pushed_while_it_is_open(tmp_path):
+    trial1, trial2 = str(tmp_path / 'trial1.wav'), str(tmp_path / 'trial2.wav')
+    recorder = Recorder(48000, 2, 2, seconds=1, period=60)
+    recorder.push(chunk(.1))  # before the first file: not recorded
+    recorder.open(trial1)
+    for i in range(3):
+        recorder.push(chunk(.25))
+    # opening the next file closes the previous one after the frames pushed so far
+    recorder.open(trial2)
+    for i in range(5):
+        recorder.push(chunk(-.25))
+    recorder.close()
+    recorder.push(chunk(.1))  # after the last file: not recorded
+    recorder.stop()
+
+    first, second = frames(trial1), frames(trial2)
+    assert first.shape == (3 * 480, 2)
+    assert second.shape == (5 * 480, 2)
+    assert np.abs(first / 32768 - .25).max() < 1e-3
+    assert np.abs(second / 32768 + .25).max() < 1e-3
+
+
+def test_close_then_open(tmp_path):
+    recorder = Recorder(16000, 1, 2, seconds=1, period=0.01)
+    for trial in range(1, 4):
+        recorder.open(str(tmp_path / ('trial' + str(trial) + '.wav')))
+        for i in range(trial):
+            recorder.push(chunk(trial / 10, 1600, 1))
+        recorder.close()
+        recorder.push(chunk(1., 160, 1))  # the end of the trial after the button, not recorded
+    recorder.stop()
+
+    for trial in range(1, 4):
+        samples = frames(str(tmp_path / ('trial' + str(trial) + '.wav')))
+        assert len(samples) == trial * 1600
+        assert np.abs(samples / 32768 - trial / 10).max() < 1e-3
+
+
+def test_full_ring_buffer_drops_frames(tmp_path, caplog):
+    trial1, trial2 = str(tmp_path / 'trial1.wav'), str(tmp_path / 'trial2.wav')
+    recorder = Recorder(16000, 1, 2, seconds=0.1, period=60, logger=logging.getLogger('test_recorder'))
+    recorder.open(trial1)
+    for i in range(3):
+        recorder.push(chunk(.5, 640, 1))
+    assert recorder.dropped == 640
+    recorder.open(trial2)
+    with caplog.at_level(logging.INFO):
+        recorder.stop()
+    assert len(frames(trial1)) == 1280
+    # the drops are counted by the callback only and each file reports its own
+    assert recorder.dropped == 640
+    assert [r.getMessage() for r in caplog.records] == ['Recording saved: ' + trial1 + ' (640 frames dropped)',
+                                                        'Recording saved: ' + trial2 + ' (0 frames dropped)']
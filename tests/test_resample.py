@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from resample import convert, length, remix, resample
+
+
+def sine(frequency, rate, frames, channels=1):
+    t = np.arange(frames) / rate
+    return np.repeat(np.sin(2 * np.pi * frequency * t)[:, np.newaxis], channels, axis=1).astype(np.float32)
+
+
+@pytest.mark.parametrize('rate, outrate', [(16000, 48000), (44100, 48000), (48000, 16000), (48000, 44100)])
+def test_resample_sine(rate, outrate):
+    x = sine(440, rate, rate // 2, 2)
+    y = resample(x, rate, outrate)
+    assert y.dtype == np.float32
+    assert y.shape == (length(len(x), rate, outrate), 2)
+    assert len(y) == -(-len(x) * outrate // rate)
+
+    # away from the edges, the output is the same sine at the new rate (aligned with the input)
+    expected = sine(440, outrate, len(y), 2)
+    edge = outrate // 100
+    error = y[edge:-edge] - expected[edge:-edge]
+    assert 20 * np.log10(np.sqrt(np.mean(error ** 2)) / np.sqrt(.5)) < -50
+
+
+def test_resample_removes_frequencies_above_the_new_nyquist():
+    y = resample(sine(12000, 48000, 24000), 48000, 16000)
+    assert np.sqrt(np.mean(y[160:-160] ** 2)) < 1e-2
+
+
+def test_resample_same_rate_and_empty():
+    x = sine(440, 16000, 100)
+    np.testing.assert_array_equal(resample(x, 16000, 16000), x)
+    assert resample(np.zeros((0, 1), dtype=np.float32), 16000, 48000).shape == (0, 1)
+    assert resample(x[:1], 16000, 48000).shape == (3, 1)
+
+
+def test_remix():
+    mono = np.arange(4, dtype=np.float32)[:, np.newaxis]
+    stereo = remix(mono, 2)
+    np.testing.assert_array_equal(stereo, np.hstack((mono, mono)))
+    np.testing.assert_array_equal(remix(stereo * [1, 3], 1), mono * 2)
+    with pytest.raises(ValueError):
+        remix(np.zeros((4, 2), dtype=np.float32), 3)
+
+
+def test_convert():
+    y = convert(sine(440, 16000, 1600), 16000, 48000, 2)
+    assert y.shape == (4800, 2)
+    np.testing.assert_array_equal(y[:, 0], y[:, 1])
@@ -0,0 +1,69 @@
+import csv
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import eventlog
+from eventlog import EventLog
+import resultlog
+from resultlog import parse_log
+from resultstore import ResultStore
+
+
+def test_round_trip(tmp_path):
+    filename = str(tmp_path / 'p1_results.txt')
+    log = EventLog(filename, period=0.01)
+    log.write('Block : 1')
+    log.write('Target audio path : stimuli/adjustment/')
+    log.write('Trial no: 1 Starting level: 3')
+    log.event(eventlog.LEVEL, 4, 1600)
+    log.input(5, time.monotonic_ns())
+    log.event(eventlog.LEVEL, 5, 3200)
+    log.write('end of adjusting')
+    log.event(eventlog.LEVEL, 1, 4800)  # after the end of the adjustment phase, not a change
+    log.write('Audio: stimuli/test/level_5/a.wav')
+    log.write('Response: a sentence')
+    log.close()
+
+    trials, changes, tests = parse_log(filename)
+    assert len(trials) == 1
+    trial = trials.iloc[0]
+    assert (trial['block'], trial['trial_no'], trial['starting_level'], trial['pref_level']) == (1, 1, 3, 5)
+    assert trial['tpath'] == 'stimuli/adjustment/'
+    assert trial['stabilization_time'] >= 0
+    assert changes['level'].tolist() == [4, 5]
+    assert changes['time'].is_monotonic_increasing
+    assert tests[['audio', 'response']].values.tolist() == [['stimuli/test/level_5/a.wav', 'a sentence']]
+
+    # the input events are only in the .csv file, with the positions of the level changes
+    with open(str(tmp_path / 'p1_events.csv')) as f:
+        rows = list(csv.DictReader(f))
+    assert [r['type'] for r in rows] == ['text'] * 3 + ['level', 'input', 'level', 'text', 'level', 'text', 'text']
+    assert [r['position'] for r in rows if r['type'] == 'level'] == ['1600', '3200', '4800']
+    assert [int(r['ns']) for r in rows] == sorted(int(r['ns']) for r in rows)
+
+
+def test_process_in_a_spawned_worker(tmp_path):
+    directory = str(tmp_path) + '/'
+    (tmp_path / 'results').mkdir()
+    log = EventLog(directory + 'results/p1_results.txt', period=0.01)
+    log.write('Block : 1')
+    log.write('Target audio path : stimuli/adjustment/')
+    log.write('Trial no: 1 Starting level: 3')
+    log.event(eventlog.LEVEL, 2, 1600)
+    log.write('end of adjusting')
+    log.close()
+
+    options = {'directory': directory, 'knob': True, 'testphase': False, 'masker': None, 'numlevels': [3],
+               'lowerlevel': 1, 'button_on': 5.0}
+    # the worker gets everything in its arguments, importing resultlog (and resultstore) reads no configuration
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        jobs = pool.submit(resultlog.process, 'p1', options).result()
+
+    assert [(job[0], job[1]) for job in jobs] == [('adjustments', directory + 'plots/p1_block1adjustments.pdf')]
+    assert jobs[0][3]['higherlevel'] == 3
+    df = pd.read_csv(directory + 'results/p1.csv')
+    assert df[['pID', 'knob', 'block', 'trial_no', 'starting_level', 'pref_level']].values.tolist() == [['p1', True, 1, 1, 3, 2]]
+    assert ResultStore(directory + 'results/alldata/').read()['pID'].astype(str).tolist() == ['p1']
@@ -0,0 +1,53 @@
+import os
+
+import pandas as pd
+
+from resultstore import COMPACTED, INDEX, ResultStore
+
+
+def rows(pid, blocks, level):
+    return pd.DataFrame({'pID': pid, 'knob': False, 'block': blocks, 'trial_no': range(1, len(blocks) + 1),
+                         'pref_level': level, 'target_audio': 'a.wav', 'snr': float('nan')})
+
+
+def shards(path):
+    return sorted(name for name in os.listdir(path) if name.endswith('.npz'))
+
+
+def test_append_read_and_compact(tmp_path):
+    store = ResultStore(str(tmp_path))
+    store.append(rows('p1', [2, 1], 3))
+    store.append(rows('p2', [1, 1, 2], 4))
+    # a participant written again replaces its rows
+    store.append(rows('p1', [1, 2], 5))
+    assert shards(tmp_path) == ['p1.npz', 'p2.npz']
+    assert os.path.exists(str(tmp_path / INDEX))
+
+    data = store.read()
+    assert len(data) == 5
+    assert data.groupby('pID')['pref_level'].first().to_dict() == {'p1': 5, 'p2': 4}
+    assert len(store.read(columns=['pID', 'pref_level'], blocks=[2])) == 2
+
+    assert store.compact() == 2
+    assert len(shards(tmp_path)) == 1 and shards(tmp_path)[0].startswith(COMPACTED)
+    assert list(store.index()) == shards(tmp_path)
+    compacted = store.read()
+    pd.testing.assert_frame_equal(compacted.sort_values(['pID', 'block', 'trial_no']).reset_index(drop=True),
+                                  data.sort_values(['pID', 'block', 'trial_no']).reset_index(drop=True))
+    assert store.compact() == 0
+
+    # rows written after the compaction are newer than the compacted ones
+    store.append(rows('p2', [1], 7))
+    data = store.read()
+    assert len(data) == 3
+    assert data.loc[data['pID'] == 'p2', 'pref_level'].tolist() == [7]
+
+
+def test_stale_index_is_refreshed(tmp_path):
+    store = ResultStore(str(tmp_path))
+    store.append(rows('p1', [1], 3))
+    with open(str(tmp_path / INDEX), 'w') as f:
+        f.write('{}')
+    assert len(store.read()) == 1
+    os.remove(str(tmp_path / 'p1.npz'))
+    assert store.index() == {}
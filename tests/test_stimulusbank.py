@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+import manifest
+from stimulusbank import StimulusBank
+
+
+@pytest.fixture
+def stimuli(stimuli_folder, tmp_path, monkeypatch):
+    monkeypatch.setattr(manifest, 'cachedir', str(tmp_path / 'cache'))
+    return manifest.load_stimuli(str(stimuli_folder), 'level_')
+
+
+@pytest.mark.parametrize('rate, nchannels', [(None, None), (48000, 2)])
+def test_modes_have_the_same_samples(stimuli, rate, nchannels):
+    memory = StimulusBank(stimuli, 3, stimuli.wavids, 2**20, 'memory', rate, nchannels)
+    mmap = StimulusBank(stimuli, 3, stimuli.wavids, 2**20, 'mmap', rate, nchannels)
+    assert mmap.native == (rate is None)
+    for level in range(1, 4):
+        for wavid, sign in (('a.wav', 1), ('b.wav', -1)):
+            a, b = np.zeros((4800, memory.nchannels), dtype=np.float32), np.zeros((4800, mmap.nchannels), dtype=np.float32)
+            n = memory.open(level, wavid).read(a)
+            assert mmap.open(level, wavid).read(b) == n
+            np.testing.assert_array_equal(a, b)
+            np.testing.assert_allclose(a[n // 10:n - n // 10], sign * level / 10, atol=1e-3)
+
+
+def test_auto_mode_and_budget(stimuli):
+    assert StimulusBank(stimuli, 3, stimuli.wavids, 2**20, 'auto').mode == 'memory'
+    assert StimulusBank(stimuli, 3, stimuli.wavids, 1000, 'auto').mode == 'mmap'
+    with pytest.raises(ValueError):
+        StimulusBank(stimuli, 3, stimuli.wavids, 1000, 'memory')
+
+
+@pytest.mark.parametrize('rate', [None, 48000])
+def test_prepared_stimulus_stays_mapped(stimuli, rate):
+    bank = StimulusBank(stimuli, 3, stimuli.wavids, 2**20, 'mmap', rate)
+    bank.maxmapped = 1
+    bank.prepare('a.wav')
+    levels = bank.mapped['a.wav']
+    # the stimuli prefetched while the prepared one plays do not unmap it, even when there is no room for them
+    bank.prefetch(2, 'b.wav')
+    assert list(bank.mapped) == ['a.wav']
+    assert bank.mapped['a.wav'] is levels
+    np.testing.assert_allclose(bank.stimulus(2, 'b.wav')[0], -.2 * 32767 if rate is None else -.2, rtol=1e-3)
+    for level in range(1, 4):
+        assert bank.stimulus(level, 'a.wav') is levels[level - 1]
+
+    bank.prepare('b.wav')
+    assert list(bank.mapped) == ['b.wav']